@@ -0,0 +1,114 @@
+"""
+Latency benchmark of the /estimate backend (estimator.py) under concurrent load, on a realistic synthetic day of scraped
+listings (see benchmark_memory.py). The index is swapped for a freshly built one in the middle of the run, as after a
+daily scrape.
+
+Estimator.estimate is called directly, so this measures the backend only: Flask routing, request parsing, jsonify and
+the network are not included in the latencies, and add to them in production.
+
+Clients send requests at a fixed total rate (open loop), and latencies are measured from the time a request was due, so
+queueing behind other threads is included. Requests overlapping the swap are reported separately, since building the
+index holds the GIL and delays them by up to the build time. Setting the rate above the throughput of the machine
+measures saturation instead, where the latency is dominated by waiting for the GIL.
+
+Usage: python benchmark_estimator.py [number_of_listings] [number_of_threads] [requests_per_thread] [requests_per_second]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import schema
+from estimator import Estimator
+from benchmark_memory import synthetic_listing
+
+
+def synthetic_query(rng):
+    """
+    Builds a single /estimate request body.
+    """
+
+    city = rng.choice(['Vilnius'] * 6 + ['Kaunas'] * 2 + ['Klaipėda', 'Šiauliai', 'Panevėžys'])
+    return {
+        'Plotas': rng.randint(15, 150),
+        'KambariuSk': rng.randint(1, 5),
+        'Metai': rng.randint(1900, 2021),
+        'Aukstas': rng.randint(1, 16),
+        'BuildingCity': city,
+        'BuildingNeighbourhood': city + ' ' + str(rng.randint(1, 40))
+    }
+
+
+def main(n_listings=3000, n_threads=8, n_requests=1000, rate=2000, seed=42):
+    rng = random.Random(seed)
+    df = schema.apply_schema(pd.DataFrame.from_records([synthetic_listing(rng, i) for i in range(n_listings)]))
+    df_swapped = schema.apply_schema(pd.DataFrame.from_records([synthetic_listing(rng, i)
+                                                                for i in range(n_listings)]))
+
+    with tempfile.TemporaryDirectory() as directory:
+        estimator = Estimator(path=os.path.join(directory, 'latest_listings.pkl'))
+
+        start = time.perf_counter()
+        estimator.swap(df)
+        print('Listings: {0}, index build: {1:.1f} ms'.format(n_listings, (time.perf_counter() - start) * 1000))
+
+        # Every thread sends every n_threads / rate seconds, offset from the others.
+        interval = n_threads / rate
+        clients_start = time.perf_counter() + 0.01
+
+        def client(thread_number):
+            thread_rng = random.Random(seed + thread_number)
+            queries = [synthetic_query(thread_rng) for _ in range(n_requests)]
+
+            latencies = []
+            for i, query in enumerate(queries):
+                due = clients_start + (i + thread_number / n_threads) * interval
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+                estimator.estimate(query)
+                latencies.append((due, time.perf_counter()))
+            return latencies
+
+        swap_times = []
+
+        def swap():
+            swap_start = time.perf_counter()
+            estimator.swap(df_swapped)
+            swap_times.extend([swap_start, time.perf_counter()])
+
+        # Swap the index while the clients are running.
+        swapper = threading.Timer(n_requests * interval / 2, swap)
+        swapper.start()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            requests = np.concatenate([np.array(result) for result in executor.map(client, range(n_threads))])
+        elapsed = time.perf_counter() - start
+        swapper.join()
+
+    latencies = (requests[:, 1] - requests[:, 0]) * 1000
+    during_swap = (requests[:, 1] >= swap_times[0]) & (requests[:, 0] <= swap_times[1])
+
+    print('Threads: {0}, requests: {1}, target rate: {2} requests/s, achieved: {3:.0f} requests/s'.format(
+        n_threads, latencies.size, rate, latencies.size / elapsed))
+    print('Index swap: {0:.1f} ms, overlapping {1} requests'.format((swap_times[1] - swap_times[0]) * 1000,
+                                                                   during_swap.sum()))
+    print('Backend latency (Estimator.estimate only, without Flask and jsonify):')
+    print('{0:<10}{1:>12}{2:>12}{3:>12}'.format('ms', 'all', 'no swap', 'swap'))
+    for name, q in [('p50', 50), ('p90', 90), ('p99', 99), ('max', 100)]:
+        print('{0:<10}{1:>12.3f}{2:>12.3f}{3:>12.3f}'.format(
+            name, np.percentile(latencies, q), np.percentile(latencies[~during_swap], q),
+            np.percentile(latencies[during_swap], q) if during_swap.any() else np.nan))
+    pass
+
+
+if __name__ == '__main__':
+    main(*[int(argument) for argument in sys.argv[1:5]])
@@ -0,0 +1,123 @@
+"""
+Memory benchmark of the DataFrame schema (schema.py) on a realistic synthetic day of scraped listings.
+
+Usage: python benchmark_memory.py [number_of_listings]
+"""
+import os
+import sys
+import random
+import string
+import tempfile
+
+import pandas as pd
+
+import schema
+from description_store import DescriptionStore
+
+
+def synthetic_listing(rng, i):
+    """
+    Builds a single processed listing, as returned by Scraper.process_object_data with list_format='wide'.
+    """
+
+    city = rng.choice(['Vilnius'] * 6 + ['Kaunas'] * 2 + ['Klaipėda', 'Šiauliai', 'Panevėžys'])
+    listing = {
+        'Plotas': rng.randint(15, 150),
+        'KainaMen': rng.randint(150, 2500),
+        'KambariuSk': rng.randint(1, 5),
+        'Aukstas': rng.randint(1, 16),
+        'AukstuSk': rng.randint(1, 16),
+        'Metai': rng.randint(1900, 2021),
+        'PastatoTipas': rng.choice(['Mūrinis', 'Blokinis', 'Monolitinis', 'Medinis', 'Karkasinis']),
+        'Sildymas': rng.choice(['Centrinis', 'Dujinis', 'Elektra', 'Geoterminis', 'Centrinis kolektorinis']),
+        'Irengimas': rng.choice(['Įrengtas', 'Dalinė apdaila', 'Neįrengtas']),
+        'NamoNumeris': str(rng.randint(1, 200)),
+        'ButoNumeris': str(rng.randint(1, 120)),
+        'PastatoEnergijosSuvartojimoKlase': rng.choice(['A++', 'A+', 'A', 'B', 'C', 'D']),
+        'BuildingEnergyClass': rng.choice(['A++', 'A+', 'A', 'B', 'C', 'D']),
+        'BuildingEnergyClassCategory': rng.choice([' pastatas', ' butas']),
+        'ArtimiausiasDarzelis': rng.randint(50, 3000),
+        'ArtimiausiaMokymoIstaiga': rng.randint(50, 3000),
+        'ArtimiausiaParduotuve': rng.randint(20, 2000),
+        'ViesojoTransportoStotele': rng.randint(10, 1500),
+        'Nusikaltimai500MSpinduliuPraejusiMenesi': rng.randint(0, 60),
+        'VidutiniskaiTiekKainuotuSildymas1Men': round(rng.uniform(10, 150), 2),
+        'ListingViewsTotal': rng.randint(10, 5000),
+        'ListingViewsToday': rng.randint(0, 200),
+        'BuildingCity': city,
+        'BuildingNeighbourhood': city + ' ' + str(rng.randint(1, 40)),
+        'BuildingStreet': 'Gatvė ' + str(rng.randint(1, 800)),
+        'ListingUrl': 'https://www.aruodas.lt/butai-vilniuje-{}/'.format(4000000 + i),
+        'ObjectDescription': ' '.join(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10)))
+                                      for _ in range(rng.randint(40, 200)))
+    }
+
+    # Optional fields, missing numbers turn integer columns into float64 in the raw DataFrame.
+    for variable in ['Metai', 'AukstuSk', 'VidutiniskaiTiekKainuotuSildymas1Men', 'ArtimiausiasDarzelis',
+                     'ArtimiausiaMokymoIstaiga', 'Nusikaltimai500MSpinduliuPraejusiMenesi']:
+        if rng.random() < 0.2:
+            listing.pop(variable)
+
+    # Realtor information.
+    if rng.random() < 0.6:
+        listing['RealtorName'] = rng.choice(['Vardenis Pavardenis {}'.format(j) for j in range(200)])
+        listing['Realtor'] = 1
+    if rng.random() < 0.4:
+        listing['RealtorOrganization'] = rng.choice(['/agentura-{}/'.format(j) for j in range(50)])
+
+    # Pseudo-categorical list variables, a few values out of a larger vocabulary each.
+    for variable, vocabulary_size, values in [('Ypatybes', 30, 6), ('PapildomosPatalpos', 15, 2),
+                                              ('PapildomaIranga', 25, 5), ('Apsauga', 10, 2)]:
+        for value in rng.sample(range(vocabulary_size), rng.randint(0, values)):
+            listing['{0}_Value{1}'.format(variable, value)] = 1
+
+    return listing
+
+
+def main(n_listings=3000, seed=42):
+    rng = random.Random(seed)
+    records = [synthetic_listing(rng, i) for i in range(n_listings)]
+
+    df_raw = pd.DataFrame.from_records(records)
+    df_schema = schema.apply_schema(df_raw)
+
+    memory_raw = schema.memory_usage(df_raw)
+    memory_schema = schema.memory_usage(df_schema)
+    memory_raw_no_text = schema.memory_usage(df_raw.drop(columns=['ObjectDescription']))
+    memory_schema_no_text = schema.memory_usage(df_schema.drop(columns=['ObjectDescription']))
+
+    # Descriptions moved into the content-addressed store, as with Scraper(store_descriptions=True). The synthetic
+    # descriptions are random letters, so their compression ratio is a lower bound of the real one.
+    with tempfile.TemporaryDirectory() as directory:
+        store = DescriptionStore(os.path.join(directory, 'descriptions.db'))
+        df_hashed = store.split(df_schema)
+        store.close()
+        memory_store = os.path.getsize(os.path.join(directory, 'descriptions.db')) / 2 ** 20
+    memory_raw_text = schema.memory_usage(df_raw[['ObjectDescription']])
+    memory_hashed = schema.memory_usage(df_hashed)
+
+    print('Listings: {0}, columns: {1}'.format(*df_raw.shape))
+    print('{0:<30}{1:>12}{2:>12}{3:>10}'.format('', 'raw, MB', 'schema, MB', 'ratio'))
+    print('{0:<30}{1:>12.2f}{2:>12.2f}{3:>10.2f}'.format('All columns', memory_raw, memory_schema,
+                                                         memory_raw / memory_schema))
+    print('{0:<30}{1:>12.2f}{2:>12.2f}{3:>10.2f}'.format('Without ObjectDescription', memory_raw_no_text,
+                                                         memory_schema_no_text,
+                                                         memory_raw_no_text / memory_schema_no_text))
+    print('{0:<30}{1:>12.2f}{2:>12.2f}{3:>10.2f}'.format('With ObjectDescriptionHash', memory_raw, memory_hashed,
+                                                         memory_raw / memory_hashed))
+    print('{0:<30}{1:>12.2f}{2:>12.2f}{3:>10.2f}'.format('ObjectDescription store', memory_raw_text, memory_store,
+                                                         memory_raw_text / memory_store))
+
+    # Largest reductions per column.
+    per_column = pd.DataFrame({
+        'raw': df_raw.memory_usage(deep=True, index=False),
+        'schema': df_schema.memory_usage(deep=True, index=False),
+        'dtype': df_schema.dtypes.astype(str)
+    })
+    per_column['saved'] = per_column['raw'] - per_column['schema']
+    print(per_column.sort_values('saved', ascending=False).head(15).to_string())
+    pass
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3000)
@@ -0,0 +1,295 @@
+import re
+import zlib
+import sqlite3
+import hashlib
+import logging
+import datetime
+
+import numpy as np
+import pandas as pd
+
+
+# Mersenne prime used for the MinHash permutations, hashes are reduced below it so the products fit into uint64.
+MERSENNE_PRIME = (1 << 31) - 1
+
+
+class Deduplicator:
+    def __init__(self, path='listing_signatures.db', num_perm=128, bands=16, threshold=0.7, shingle_size=5,
+                 area_bin=5, area_tolerance=2, seed=1):
+        """
+        Finds near-duplicate listings, e.g. the same flat listed by different realtors with a reworded description.
+
+        Descriptions are split into character shingles and summarized into MinHash signatures. Signatures are split
+        into bands and hashed into buckets together with a blocking key (street, number of rooms, area bin), so only
+        listings of the same flat can become candidates. Candidates are confirmed with the estimated Jaccard similarity
+        of the descriptions, which keeps the whole stage near-linear instead of comparing all pairs.
+
+        Signatures and buckets are kept in SQLite, so every day is matched incrementally against the whole history.
+
+        Sources:
+            [1] Leskovec, Rajaraman, Ullman. Mining of Massive Datasets, chapter 3. http://www.mmds.org/
+
+        Parameters
+        ----------
+        path (str): path of the SQLite database with the signature index.
+        num_perm (int): number of MinHash permutations, i.e. the signature length.
+        bands (int): number of LSH bands, num_perm must be divisible by it. More bands find less similar candidates.
+        threshold (float): minimum estimated Jaccard similarity of the descriptions to be considered duplicates.
+        shingle_size (int): number of characters in a shingle.
+        area_bin (int): width of the area (Plotas) bins of the blocking key, in square meters.
+        area_tolerance (int): maximum area difference of duplicates, in square meters.
+        seed (int): seed of the permutations. Must stay the same for the lifetime of the index.
+        """
+
+        if num_perm % bands != 0:
+            raise ValueError('num_perm ({0}) must be divisible by bands ({1}).'.format(num_perm, bands))
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.area_bin = area_bin
+        self.area_tolerance = area_tolerance
+
+        # Random hash functions of the form (a * x + b) mod p.
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS signatures (
+                    listing_url TEXT PRIMARY KEY,
+                    cluster_id INTEGER NOT NULL,
+                    date TEXT NOT NULL,
+                    area REAL,
+                    signature BLOB NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS signatures_cluster ON signatures (cluster_id);
+
+                CREATE TABLE IF NOT EXISTS buckets (
+                    bucket INTEGER NOT NULL,
+                    listing_url TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS buckets_bucket ON buckets (bucket);
+            """)
+        pass
+
+    def shingles(self, text):
+        """
+        Parameters
+        ----------
+        text (str): description text.
+
+        Returns
+        -------
+        (numpy.ndarray): unique hashed character shingles of the normalized text.
+        """
+
+        text = re.sub(r'\s+', ' ', re.sub(r'<[^>]*>', ' ', str(text)).lower()).strip()
+        if len(text) < self.shingle_size:
+            text = text.ljust(self.shingle_size)
+
+        # Stable across processes, unlike the built-in hash.
+        hashes = {zlib.crc32(text[i:i + self.shingle_size].encode('utf-8'))
+                  for i in range(len(text) - self.shingle_size + 1)}
+        return np.fromiter(hashes, dtype=np.uint64, count=len(hashes)) % np.uint64(MERSENNE_PRIME)
+
+    def signature(self, text):
+        """
+        Parameters
+        ----------
+        text (str): description text.
+
+        Returns
+        -------
+        (numpy.ndarray): MinHash signature of num_perm uint32 values.
+        """
+
+        shingles = self.shingles(text)
+        hashes = (np.outer(self.a, shingles) + self.b[:, None]) % np.uint64(MERSENNE_PRIME)
+        return hashes.min(axis=1).astype(np.uint32)
+
+    def block_keys(self, street, rooms, area, query=False):
+        """
+        Blocking keys of a listing. A listing is indexed under its own area bin, but queried under the neighbouring
+        bins as well, so that areas close to a bin edge still match.
+
+        Returns
+        -------
+        (list): blocking key strings.
+        """
+
+        street = str(street).strip().lower()
+        rooms = '' if pd.isna(rooms) else str(int(rooms))
+        if pd.isna(area):
+            return ['{0}|{1}|'.format(street, rooms)]
+
+        area_bin = int(area) // self.area_bin
+        area_bins = [area_bin - 1, area_bin, area_bin + 1] if query else [area_bin]
+        return ['{0}|{1}|{2}'.format(street, rooms, b) for b in area_bins]
+
+    def buckets(self, signature, block_keys):
+        """
+        Returns
+        -------
+        (list): LSH bucket ids, one per band and blocking key.
+        """
+
+        buckets = []
+        for block_key in block_keys:
+            for band in range(self.bands):
+                band_values = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+                digest = hashlib.blake2b(block_key.encode('utf-8') + bytes([band]) + band_values, digest_size=8)
+                buckets.append(int.from_bytes(digest.digest(), 'big', signed=True))
+        return buckets
+
+    def candidates(self, buckets):
+        """
+        Returns
+        -------
+        (list): (listing_url, cluster_id, area, signature) of the indexed listings sharing any of the buckets.
+        """
+
+        query = """
+            SELECT DISTINCT signatures.listing_url, cluster_id, area, signature
+            FROM buckets JOIN signatures ON buckets.listing_url = signatures.listing_url
+            WHERE bucket IN ({})
+        """.format(', '.join('?' * len(buckets)))
+
+        return [(url, cluster_id, area, np.frombuffer(signature, dtype=np.uint32)) for url, cluster_id, area, signature
+                in self.connection.execute(query, buckets)]
+
+    def matches(self, signature, area, other_signature, other_area):
+        """
+        Returns
+        -------
+        (bool): whether two listings are near-duplicates, by their estimated description similarity and area.
+        """
+
+        area_matches = (area is None) or (other_area is None) or (abs(area - other_area) <= self.area_tolerance)
+        return area_matches and (np.mean(signature == other_signature) >= self.threshold)
+
+    def matches_cluster(self, signature, area, cluster_id):
+        """
+        Returns
+        -------
+        (bool): whether a listing is a near-duplicate of every listing of the cluster.
+        """
+
+        return all(self.matches(signature, area, np.frombuffer(member_signature, dtype=np.uint32), member_area)
+                   for member_area, member_signature in self.connection.execute(
+                       'SELECT area, signature FROM signatures WHERE cluster_id = ?', (cluster_id,)))
+
+    def next_cluster_id(self):
+        cluster_id = self.connection.execute('SELECT MAX(cluster_id) FROM signatures').fetchone()[0]
+        return cluster_id + 1 if cluster_id is not None else 0
+
+    def assign_clusters(self, df, date=None):
+        """
+        Assigns a cluster id to every listing, near-duplicates share the same id. Listings are matched against each
+        other as well as against all of the previously indexed listings, then added to the index.
+
+        A listing only joins a cluster if it is a near-duplicate of every listing in it, clusters are never merged.
+        Otherwise, chains of listings each close to the next one (e.g. the same template on one street with areas
+        2 m² apart) would end up in a single cluster, however far apart its ends are.
+
+        Parameters
+        ----------
+        df (pandas.DataFrame): processed listings with ListingUrl, ObjectDescription, BuildingStreet, KambariuSk and
+         Plotas columns.
+        date (str): ISO formatted date the listings are indexed under, today if None.
+
+        Returns
+        -------
+        pandas.DataFrame: listings with an additional ClusterId column.
+        """
+
+        date = date if date is not None else datetime.date.today().isoformat()
+
+        if df.shape[0] == 0:
+            df = df.copy()
+            df['ClusterId'] = pd.array([], dtype='UInt32')
+            return df
+
+        cluster_ids = []
+        duplicates = 0
+        with self.connection:
+            for url, description, street, rooms, area in df.reindex(
+                    columns=['ListingUrl', 'ObjectDescription', 'BuildingStreet', 'KambariuSk',
+                             'Plotas']).itertuples(index=False):
+
+                # Listings already in the index keep their cluster.
+                row = self.connection.execute('SELECT cluster_id FROM signatures WHERE listing_url = ?',
+                                              (url,)).fetchone()
+                if row is not None:
+                    cluster_ids.append(row[0])
+                    continue
+
+                signature = self.signature(description)
+                area = None if pd.isna(area) else float(area)
+
+                # Confirm the candidates by their estimated similarity and area, then against the whole cluster.
+                matches = sorted({cluster_id for _, cluster_id, candidate_area, candidate_signature in self.candidates(
+                    self.buckets(signature, self.block_keys(street, rooms, area, query=True)))
+                    if self.matches(signature, area, candidate_signature, candidate_area)})
+                cluster_id = next((cluster_id for cluster_id in matches
+                                   if self.matches_cluster(signature, area, cluster_id)), None)
+
+                if cluster_id is not None:
+                    duplicates += 1
+                else:
+                    cluster_id = self.next_cluster_id()
+
+                self.connection.execute('INSERT INTO signatures VALUES (?, ?, ?, ?, ?)',
+                                        (url, cluster_id, date, area, signature.tobytes()))
+                self.connection.executemany('INSERT INTO buckets VALUES (?, ?)',
+                                            [(bucket, url) for bucket in
+                                             self.buckets(signature, self.block_keys(street, rooms, area))])
+                cluster_ids.append(cluster_id)
+
+        logging.info('Found {0} near-duplicate listings out of {1}.'.format(duplicates, df.shape[0]))
+
+        df = df.copy()
+        df['ClusterId'] = pd.array(cluster_ids, dtype='UInt32')
+        return df
+
+    def close(self):
+        self.connection.close()
+        pass
+
+
+def check_chaining(path=':memory:'):
+    """
+    Checks that a chain of listings, each a near-duplicate of the next one only, is not merged into a single cluster.
+    Ten templated listings on one street with 2 rooms and areas of 40, 42, ..., 58 m² must keep the ones more than
+    area_tolerance apart in separate clusters.
+
+    Usage: python deduplication.py
+    """
+
+    template = 'Parduodamas jaukus {0} kambarių butas Žirmūnų g., renovuotas namas, šalia parkas ir mokykla.'
+    df = pd.DataFrame({
+        'ListingUrl': ['https://example.com/{}'.format(i) for i in range(10)],
+        'ObjectDescription': [template.format(2)] * 10,
+        'BuildingStreet': ['Žirmūnų g.'] * 10,
+        'KambariuSk': [2] * 10,
+        'Plotas': [40.0 + 2 * i for i in range(10)]
+    })
+
+    deduplicator = Deduplicator(path=path)
+    df = deduplicator.assign_clusters(df)
+    deduplicator.close()
+
+    for cluster_id, cluster in df.groupby('ClusterId'):
+        span = cluster['Plotas'].max() - cluster['Plotas'].min()
+        assert span <= deduplicator.area_tolerance, 'Cluster {0} spans {1} m².'.format(cluster_id, span)
+
+    print('Clusters: {0}'.format(df['ClusterId'].tolist()))
+    pass
+
+
+if __name__ == '__main__':
+    check_chaining()
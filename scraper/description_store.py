@@ -0,0 +1,166 @@
+import zlib
+import sqlite3
+import hashlib
+import logging
+import datetime
+
+import pandas as pd
+
+
+# Above this many hashes, lookups are split into several queries, SQLite limits the number of parameters.
+MAX_QUERY_HASHES = 500
+
+
+class DescriptionStore:
+    def __init__(self, path='descriptions.db', level=9):
+        """
+        Content-addressed store of the listing descriptions (ObjectDescription), by far the largest field of a listing.
+
+        Every distinct text is compressed and stored once under the hash of its content, so the main DataFrame only
+        keeps a short ObjectDescriptionHash column. The same description scraped again on later days, or shared by
+        several listings, costs nothing but its hash.
+
+        Parameters
+        ----------
+        path (str): path of the SQLite database with the compressed texts.
+        level (int): zlib compression level.
+        """
+
+        self.level = level
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS descriptions (
+                    hash TEXT PRIMARY KEY,
+                    first_seen TEXT NOT NULL,
+                    text BLOB NOT NULL
+                ) WITHOUT ROWID;
+            """)
+        pass
+
+    @staticmethod
+    def hash(text):
+        """
+        Returns
+        -------
+        (str): 128-bit hex content hash of the text, stable across processes and runs.
+        """
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+    def put(self, texts, date=None):
+        """
+        Stores the texts not stored yet, in a single transaction.
+
+        Parameters
+        ----------
+        texts (iterable): description texts, missing ones (None or nan) are skipped.
+        date (str): ISO formatted date the new texts are first seen on, today if None.
+
+        Returns
+        -------
+        (list): content hash per text, None for the missing ones.
+        """
+
+        date = date if date is not None else datetime.date.today().isoformat()
+
+        hashes = []
+        new = {}
+        for text in texts:
+            if (text is None) or (not isinstance(text, str) and pd.isna(text)):
+                hashes.append(None)
+                continue
+
+            text = str(text)
+            text_hash = self.hash(text)
+            hashes.append(text_hash)
+            if text_hash not in new:
+                new[text_hash] = text
+
+        existing = set(self.get_many(list(new.keys()), decompress=False).keys())
+        rows = [(text_hash, date, zlib.compress(text.encode('utf-8'), self.level)) for text_hash, text in new.items()
+                if text_hash not in existing]
+
+        with self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO descriptions VALUES (?, ?, ?)', rows)
+
+        logging.info('Stored {0} new descriptions out of {1}, {2:.2f} MB compressed.'.format(
+            len(rows), len(hashes), sum(len(row[2]) for row in rows) / 2 ** 20))
+        return hashes
+
+    def get(self, text_hash):
+        """
+        Returns
+        -------
+        (str): text of the given hash, None if it is not stored.
+        """
+
+        row = self.connection.execute('SELECT text FROM descriptions WHERE hash = ?', (text_hash,)).fetchone()
+        return zlib.decompress(row[0]).decode('utf-8') if row is not None else None
+
+    def get_many(self, hashes, decompress=True):
+        """
+        Parameters
+        ----------
+        hashes (iterable): content hashes, missing ones (None or nan) are skipped.
+        decompress (bool): whether to decompress the texts, otherwise the compressed bytes are returned.
+
+        Returns
+        -------
+        (dict): hash -> text of the stored hashes.
+        """
+
+        hashes = list({text_hash for text_hash in hashes if isinstance(text_hash, str)})
+
+        texts = {}
+        for start in range(0, len(hashes), MAX_QUERY_HASHES):
+            chunk = hashes[start:start + MAX_QUERY_HASHES]
+            query = 'SELECT hash, text FROM descriptions WHERE hash IN ({})'.format(', '.join('?' * len(chunk)))
+            for text_hash, text in self.connection.execute(query, chunk):
+                texts[text_hash] = zlib.decompress(text).decode('utf-8') if decompress else text
+        return texts
+
+    def split(self, df, date=None):
+        """
+        Moves the descriptions of the listings into the store.
+
+        Parameters
+        ----------
+        df (pandas.DataFrame): processed listings with an ObjectDescription column.
+        date (str): ISO formatted date the new texts are first seen on, today if None.
+
+        Returns
+        -------
+        pandas.DataFrame: listings with an ObjectDescriptionHash column instead of ObjectDescription.
+        """
+
+        if 'ObjectDescription' not in df.columns:
+            return df
+
+        hashes = self.put(df['ObjectDescription'].tolist(), date)
+
+        df = df.drop(columns=['ObjectDescription'])
+        df['ObjectDescriptionHash'] = pd.Series(hashes, index=df.index, dtype=object)
+        return df
+
+    def join(self, df):
+        """
+        Looks the descriptions of the listings up, the opposite of split.
+
+        Parameters
+        ----------
+        df (pandas.DataFrame): listings with an ObjectDescriptionHash column.
+
+        Returns
+        -------
+        pandas.DataFrame: listings with an additional ObjectDescription column.
+        """
+
+        texts = self.get_many(df['ObjectDescriptionHash'])
+
+        df = df.copy()
+        df['ObjectDescription'] = df['ObjectDescriptionHash'].map(texts)
+        return df
+
+    def close(self):
+        self.connection.close()
+        pass
@@ -0,0 +1,230 @@
+import os
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+
+class ComparablesIndex:
+    # Attributes the comparables are searched by and the estimated target.
+    features = ['Plotas', 'KambariuSk', 'Metai', 'Aukstas']
+    target = 'KainaMen'
+    comparable_columns = ['ListingUrl', 'KainaMen', 'Plotas', 'KambariuSk', 'Metai', 'Aukstas', 'BuildingCity',
+                          'BuildingNeighbourhood', 'BuildingStreet']
+
+    def __init__(self, df, k=10, min_partition_size=None):
+        """
+        Immutable in-memory index of the latest scraped listings, used to find comparable listings and estimate rent.
+
+        Listings are partitioned by BuildingCity and BuildingNeighbourhood, with a KD-tree over the standardized
+        features within each partition, as well as per city and over all of the listings. A query uses the most
+        specific partition with enough listings, so a single estimate is a dictionary lookup and a KD-tree query.
+
+        Parameters
+        ----------
+        df (pandas.DataFrame): scraped listings, as returned by Scraper.scrape.
+        k (int): number of comparables used per estimate.
+        min_partition_size (int): minimum number of listings in a partition to be used, k if None.
+        """
+
+        self.k = k
+        self.min_partition_size = min_partition_size if min_partition_size is not None else k
+
+        df = df[df[self.target].notna() & df['Plotas'].notna() & (df['Plotas'] > 0)]
+
+        # Keep a single listing out of every group of near-duplicates.
+        if 'ClusterId' in df.columns:
+            df = df.drop_duplicates(subset='ClusterId')
+
+        if df.shape[0] == 0:
+            raise ValueError('No listings with {} and Plotas to build the index from.'.format(self.target))
+
+        features = df.reindex(columns=self.features).astype(float)
+        self.medians = features.median().fillna(0).values
+        self.scales = features.std().replace(0, 1).fillna(1).values
+
+        # Area is by far the strongest driver of rent, weight it more.
+        self.weights = np.array([2.0, 1.0, 0.5, 0.5])
+
+        points = self.transform(features.values)
+        price_per_area = (df[self.target].astype(float) / df['Plotas'].astype(float)).values
+        comparables = df.reindex(columns=self.comparable_columns).astype(object)
+        comparables = comparables.where(comparables.notna(), None).to_dict('records')
+
+        city = df['BuildingCity'].astype(str).values if 'BuildingCity' in df.columns else np.full(df.shape[0], '')
+        neighbourhood = df['BuildingNeighbourhood'].astype(str).values if 'BuildingNeighbourhood' in df.columns \
+            else np.full(df.shape[0], '')
+
+        self.partitions = {}
+        for key, rows in pd.Series(np.arange(df.shape[0])).groupby([city, neighbourhood]).groups.items():
+            self.add_partition(key, rows.values, points, price_per_area, comparables)
+        for key, rows in pd.Series(np.arange(df.shape[0])).groupby(city).groups.items():
+            self.add_partition((key, None), rows.values, points, price_per_area, comparables)
+        self.add_partition((None, None), np.arange(df.shape[0]), points, price_per_area, comparables,
+                           always=True)
+
+        self.size = df.shape[0]
+        pass
+
+    def add_partition(self, key, rows, points, price_per_area, comparables, always=False):
+        if (len(rows) < self.min_partition_size) and not always:
+            return
+        self.partitions[key] = (cKDTree(points[rows]), price_per_area[rows], [comparables[i] for i in rows])
+        pass
+
+    def transform(self, values):
+        """
+        Imputes missing features with their medians and standardizes them.
+        """
+        values = np.where(np.isnan(values), self.medians, values)
+        return (values - self.medians) / self.scales * self.weights
+
+    def partition(self, city, neighbourhood):
+        """
+        Returns
+        -------
+        (tuple): the most specific partition with enough listings for the given location.
+        """
+        for key in [(city, neighbourhood), (city, None), (None, None)]:
+            if key in self.partitions:
+                return key, self.partitions[key]
+
+    def estimate(self, listing):
+        """
+        Estimates the rent of a listing as the area times the inverse distance weighted price per square meter of its
+        k nearest comparables.
+
+        Parameters
+        ----------
+        listing (dict): Plotas (required), KambariuSk, Metai, Aukstas, BuildingCity, BuildingNeighbourhood.
+
+        Returns
+        -------
+        (dict): estimate, the partition used and the comparables with their distances.
+
+        Raises
+        ------
+        ValueError: In the case of a missing or invalid Plotas, or of any other invalid feature.
+        """
+
+        try:
+            area = float(listing['Plotas'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Plotas must be given as a number.')
+        if not np.isfinite(area) or (area <= 0):
+            raise ValueError('Plotas must be a positive finite number.')
+
+        # Missing (None) features are imputed, while anything else must be a finite number.
+        values = np.full(len(self.features), np.nan)
+        for i, feature in enumerate(self.features):
+            if listing.get(feature) is None:
+                continue
+            try:
+                values[i] = float(listing[feature])
+            except (TypeError, ValueError):
+                raise ValueError('{} must be given as a number.'.format(feature))
+            if not np.isfinite(values[i]):
+                raise ValueError('{} must be a finite number.'.format(feature))
+
+        for feature in ['BuildingCity', 'BuildingNeighbourhood']:
+            if not isinstance(listing.get(feature), (str, type(None))):
+                raise ValueError('{} must be given as a string.'.format(feature))
+
+        key, (tree, price_per_area, comparables) = self.partition(listing.get('BuildingCity'),
+                                                                  listing.get('BuildingNeighbourhood'))
+
+        k = min(self.k, len(comparables))
+        distances, rows = tree.query(self.transform(values), k=k)
+        distances, rows = np.atleast_1d(distances), np.atleast_1d(rows)
+
+        weights = 1 / (distances + 1e-3)
+        estimate = area * np.sum(weights * price_per_area[rows]) / np.sum(weights)
+
+        return {
+            'estimate': round(float(estimate), 2),
+            'partition': {'BuildingCity': key[0], 'BuildingNeighbourhood': key[1]},
+            'comparables': [dict(comparables[row], distance=round(float(distance), 4)) for distance, row in
+                            zip(distances, rows)]
+        }
+
+
+class Estimator:
+    def __init__(self, path='latest_listings.pkl', k=10):
+        """
+        Serves rent estimates from a ComparablesIndex, which can be swapped for a new one at any time.
+
+        The index is immutable and swapped with a single reference assignment, so requests being served concurrently
+        keep using the index they started with and never see a partially built one.
+
+        Parameters
+        ----------
+        path (str): path of the latest scraped listings, loaded on initialization if it exists.
+        k (int): number of comparables used per estimate.
+        """
+
+        self.path = path
+        self.k = k
+        self.index = None
+        self.lock = threading.Lock()
+
+        if os.path.exists(path):
+            self.swap(pd.read_pickle(path))
+        pass
+
+    def swap(self, df):
+        """
+        Builds a new index from the given listings and atomically replaces the current one.
+
+        Parameters
+        ----------
+        df (pandas.DataFrame): scraped listings, as returned by Scraper.scrape.
+        """
+
+        # Built outside of the lock, only concurrent swaps are serialized.
+        index = ComparablesIndex(df, k=self.k)
+        with self.lock:
+            self.index = index
+
+        logging.info('Swapped the comparables index, {} listings.'.format(index.size))
+        pass
+
+    def update(self, df):
+        """
+        Saves the latest scraped listings and swaps the index.
+
+        Parameters
+        ----------
+        df (pandas.DataFrame): scraped listings, as returned by Scraper.scrape.
+        """
+
+        self.swap(df)
+        df.to_pickle(self.path)
+        pass
+
+    def estimate(self, listings):
+        """
+        Parameters
+        ----------
+        listings (dict or list): a single listing or a list of them, see ComparablesIndex.estimate.
+
+        Returns
+        -------
+        (dict or list): estimate(s) in the same shape as the input.
+
+        Raises
+        ------
+        RuntimeError: In the case of no index being available yet.
+        ValueError: In the case of invalid listings.
+        """
+
+        index = self.index
+        if index is None:
+            raise RuntimeError('No scraped listings available yet.')
+
+        if isinstance(listings, list):
+            return [index.estimate(listing) for listing in listings]
+        if isinstance(listings, dict):
+            return index.estimate(listings)
+        raise ValueError('Expected a listing object or a list of them.')
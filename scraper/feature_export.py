@@ -0,0 +1,227 @@
+import os
+import json
+import datetime
+import logging
+
+import numpy as np
+import pandas as pd
+
+import schema
+
+
+class FeatureExporter:
+    # Categorical variables one-hot encoded into Variable=Value columns. High cardinality identifiers (streets,
+    # realtors, house numbers) are left out.
+    variables_one_hot = ['PastatoTipas', 'Sildymas', 'Irengimas', 'PastatoEnergijosSuvartojimoKlase',
+                         'BuildingEnergyClass', 'BuildingEnergyClassCategory', 'BuildingCity', 'BuildingNeighbourhood']
+
+    def __init__(self, directory='features'):
+        """
+        Exports the processed listings into numeric feature matrices for model retraining.
+
+        Every column gets a stable id the first time it is seen (columns.json, append-only), and every day is saved as
+        a separate .npy matrix, so retraining can memory-map any range of days without re-encoding the history. Since
+        ids only grow, the matrix of an older day holds a prefix of the current columns.
+
+        Parameters
+        ----------
+        directory (str): directory the matrices and the column ids are stored in.
+        """
+
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        self.columns_path = os.path.join(directory, 'columns.json')
+        if os.path.exists(self.columns_path):
+            with open(self.columns_path, 'r', encoding='utf-8') as f:
+                self.columns = json.load(f)
+        else:
+            self.columns = []
+
+        self.ids = {name: i for i, name in enumerate(self.columns)}
+        pass
+
+    def column_id(self, name):
+        """
+        Returns
+        -------
+        (int): stable id of a column, assigned if the column is new.
+        """
+
+        if name not in self.ids:
+            self.ids[name] = len(self.columns)
+            self.columns.append(name)
+        return self.ids[name]
+
+    @staticmethod
+    def is_numeric(name):
+        """
+        Returns
+        -------
+        (bool): whether a column holds integer or float values, as opposed to 0/1 flags and one-hot columns.
+        """
+
+        dtype = schema.dtype_of(name)
+        return (dtype is not None) and (dtype not in ['category', schema.flag_dtype]) and \
+            (name not in schema.variables_identifiers)
+
+    def missing_values(self, n_columns=None):
+        """
+        Parameters
+        ----------
+        n_columns (int): number of the first columns to return, all of them if None.
+
+        Returns
+        -------
+        (numpy.ndarray): value of every column for listings without it - nan for numeric columns, where 0 is a valid
+         value (e.g. 0 favorites), 0 for flags and one-hot columns.
+        """
+
+        return np.array([np.nan if self.is_numeric(name) else 0 for name in self.columns[:n_columns]],
+                        dtype=np.float32)
+
+    def encode(self, df, list_features=None):
+        """
+        Encodes listings into (column id -> values) numeric columns.
+
+        Integer and float variables from schema.py are kept as they are (missing values are nan), categoricals are
+        one-hot encoded and pseudo-categorical Variable_Value flags are 0/1, taken either from the wide columns or from
+        the long list_features table.
+
+        Parameters
+        ----------
+        df (pandas.DataFrame): processed listings.
+        list_features (pandas.DataFrame): optional long format list features, see Scraper(list_format='long').
+
+        Returns
+        -------
+        (dict): column id -> numpy.ndarray of float32 values.
+        """
+
+        encoded = {}
+        for name in df.columns.values:
+            dtype = schema.dtype_of(name)
+
+            if name in self.variables_one_hot:
+                values = df[name].astype(str).where(df[name].notna())
+                for value in values.dropna().unique():
+                    encoded[self.column_id(name + '=' + value)] = (values == value).values.astype(np.float32)
+
+            elif dtype == schema.flag_dtype:
+                encoded[self.column_id(name)] = pd.to_numeric(df[name]).fillna(0).values.astype(np.float32)
+
+            elif self.is_numeric(name):
+                encoded[self.column_id(name)] = df[name].to_numpy(dtype=np.float32, na_value=np.nan)
+
+        if list_features is not None:
+            rows = pd.Index(df['ListingUrl']).get_indexer(list_features['ListingUrl'])
+            tokens = (list_features['Variable'].astype(str) + '_' + list_features['Value'].astype(str)).values
+            for token in pd.unique(tokens):
+                column = np.zeros(df.shape[0], dtype=np.float32)
+                token_rows = rows[(tokens == token) & (rows >= 0)]
+                column[token_rows] = 1
+                encoded[self.column_id(token)] = column
+
+        return encoded
+
+    def export(self, df, date=None, list_features=None):
+        """
+        Encodes and saves a day of listings as a float32 matrix, with the listing urls saved alongside.
+
+        Parameters
+        ----------
+        df (pandas.DataFrame): processed listings.
+        date (str): ISO formatted date of the listings, today if None.
+        list_features (pandas.DataFrame): optional long format list features, see Scraper(list_format='long').
+
+        Returns
+        -------
+        (str): path of the saved matrix.
+        """
+
+        date = date if date is not None else datetime.date.today().isoformat()
+        encoded = self.encode(df, list_features)
+
+        # Written straight into the memory-mapped file, column by column. Columns absent on this day are missing.
+        path = os.path.join(self.directory, date + '.npy')
+        matrix = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(df.shape[0], len(self.columns)))
+        matrix[:] = self.missing_values()
+        for column_id, values in encoded.items():
+            matrix[:, column_id] = values
+        matrix.flush()
+        del matrix
+
+        # Fixed width unicode, so the urls can be memory-mapped as well.
+        np.save(os.path.join(self.directory, date + '.urls.npy'), np.array(df['ListingUrl'].astype(str).tolist(),
+                                                                           dtype=str))
+
+        # Columns are saved last, so they always cover the matrices on disk.
+        with open(self.columns_path, 'w', encoding='utf-8') as f:
+            json.dump(self.columns, f, ensure_ascii=False)
+
+        logging.info('Exported {0} listings with {1} features to {2}.'.format(df.shape[0], len(self.columns), path))
+        return path
+
+    def dates(self):
+        """
+        Returns
+        -------
+        (list): ISO formatted dates of the exported days.
+        """
+        return sorted(name[:-len('.npy')] for name in os.listdir(self.directory)
+                      if name.endswith('.npy') and not name.endswith('.urls.npy'))
+
+    def load(self, start=None, end=None, half_life_days=30, today=None):
+        """
+        Memory-maps the exported days of an inclusive date window, without copying them.
+
+        Parameters
+        ----------
+        start (str): first ISO formatted date of the window, unbounded if None.
+        end (str): last ISO formatted date of the window, unbounded if None.
+        half_life_days (float): age in days at which the recency weight of a listing halves.
+        today (str): ISO formatted date the recency is measured from, today if None.
+
+        Returns
+        -------
+        (list): (date, matrix, urls, recency weight) per day. The matrix is a read-only numpy.memmap, whose columns
+         are the first matrix.shape[1] of self.columns.
+        """
+
+        today = datetime.date.fromisoformat(today) if today is not None else datetime.date.today()
+
+        days = []
+        for date in self.dates():
+            if ((start is not None) and (date < start)) or ((end is not None) and (date > end)):
+                continue
+
+            matrix = np.load(os.path.join(self.directory, date + '.npy'), mmap_mode='r')
+            urls = np.load(os.path.join(self.directory, date + '.urls.npy'), mmap_mode='r')
+            age = (today - datetime.date.fromisoformat(date)).days
+            days.append((date, matrix, urls, 0.5 ** (age / half_life_days)))
+        return days
+
+    def training_matrix(self, start=None, end=None, half_life_days=30, today=None):
+        """
+        Stacks the exported days of a window into a single training matrix, padding the columns of older days as
+        missing (see missing_values), along with per-row recency weights. Unlike load, this copies the data.
+
+        Returns
+        -------
+        (numpy.ndarray, numpy.ndarray): features and recency weights.
+        """
+
+        days = self.load(start, end, half_life_days, today)
+        n_columns = max([matrix.shape[1] for _, matrix, _, _ in days], default=0)
+
+        X = np.empty((sum(matrix.shape[0] for _, matrix, _, _ in days), n_columns), dtype=np.float32)
+        X[:] = self.missing_values(n_columns)
+        weights = np.empty(X.shape[0], dtype=np.float32)
+
+        row = 0
+        for _, matrix, _, weight in days:
+            X[row:row + matrix.shape[0], :matrix.shape[1]] = matrix
+            weights[row:row + matrix.shape[0]] = weight
+            row += matrix.shape[0]
+
+        return X, weights
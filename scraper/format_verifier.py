@@ -1,29 +1,32 @@
-import numpy as np
 import os
+import numpy as np
+import datetime
 
 import json
 import logging
+from collections import Counter
 
 from scipy import stats
 
+import schema
+from running_statistics import RunningStatistics
+from quantile_sketch import QuantileSketch, ks_distance, quantile_deltas
+from historical_store import HistoricalStore
+from schema_registry import SchemaRegistry
+from profiling import Profiler
 
-class NpEncoder(json.JSONEncoder):
+
+class VerificationError(Exception):
     """
-    Class stolen from stack overflow to handle Lithuanian encodings for the json library.
+    Raised when the scraped data crosses any of the fail-fast thresholds of config_verifier.json.
     """
-    def default(self, obj):
-        if isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        else:
-            return super(NpEncoder, self).default(obj)
+    pass
 
 
 class FormatVerifier:
-    def __init__(self, p_value=0.05, missing_value_deviation=0.1):
+    def __init__(self, p_value=0.05, missing_value_deviation=0.1, ks_distance=0.1, quantiles=(0.1, 0.5, 0.9, 0.99),
+                 quantile_deviation=0.2, sketch_size=200, history_days=None, retire_days=30, date=None, profile=False,
+                 quarantine_directory='quarantine'):
         """
         Class used to verify the various formats of the dataset acquired from the scraper.
 
@@ -32,10 +35,28 @@ class FormatVerifier:
         p_value (float): p-value limit which, if exceeded, is considered to have failed the statistical test.
         missing_value_deviation (float): maximum allowed percentage deviation from the historical values until which
          it is considered accepted.
+        ks_distance (float): maximum allowed Kolmogorov-Smirnov distance between the historical and the current
+         distribution of a variable.
+        quantiles (tuple): quantiles compared between the historical and the current distribution of a variable.
+        quantile_deviation (float): maximum allowed deviation of any of the quantiles, relative to the historical
+         interquartile range.
+        sketch_size (int): size of the quantile sketches, controls their accuracy and memory.
+        history_days (int): number of preceding days the data is compared against, all of the history if None.
+        retire_days (int): Variables not seen for longer than this many days are no longer expected in the data.
+        date (str): ISO formatted date the verified data is stored under, today if None.
+        profile (bool): whether to profile the checks, dumped into profiles/ at the end of verify().
+        quarantine_directory (str): directory the data failing the fail-fast thresholds is saved into.
         """
 
         self.p_value = p_value
         self.missing_deviation = missing_value_deviation
+        self.ks_distance = ks_distance
+        self.quantiles = list(quantiles)
+        self.quantile_deviation = quantile_deviation
+        self.sketch_size = sketch_size
+        self.history_days = history_days
+        self.date = date if date is not None else datetime.date.today().isoformat()
+        self.quarantine_directory = quarantine_directory
 
         # Setup Logging.
         # TODO: There is a weird issue with encoding which can't encode lithuanian e with a dot. Seems to cause no
@@ -52,21 +73,39 @@ class FormatVerifier:
         with open('config_verifier.json', 'r', encoding='utf-8') as f:
             self.config = json.load(f)
 
-        # Load, if historical_dataset_info file exists.
-        if os.path.exists('historical_dataset_info.json'):
-            with open('historical_dataset_info.json', 'r', encoding='utf-8') as f:
-                self.historical_info = json.load(f)
-        else:
-            self.historical_info = {
-                'names': {
-                    'variable_names': [],
-                    'value_names': []
-                },
-                'statistics': {}
-            }
+        # Open the historical dataset info store, older historical_dataset_info.json files are imported on first use.
+        self.store = HistoricalStore('historical_dataset_info.db', legacy_path='historical_dataset_info.json')
+        self.registry = SchemaRegistry(self.store, self.date, retire_days=retire_days)
+        self.profiler = Profiler('format_verifier', enabled=profile)
+        self.string_types = set(self.config['types']['string'])
+        self.thresholds = self.config['thresholds']
+
+        # Statistics of the current batch, accumulated with update_statistics.
+        self.batch_statistics = {}
+        self.batch_sketches = {}
+        self.batch_samples_total = 0
+
+        # Running counts of the micro-batches streamed with verify_batch.
+        self.stream_batches = 0
+        self.stream_pages = 0
+        self.stream_samples = 0
+        self.stream_missing = Counter()
+        self.stream_reported = set()
 
         pass
 
+    def history_window(self):
+        """
+        Returns
+        -------
+        (str, str): first and last ISO formatted dates of the history the checked date is compared against.
+        """
+
+        date = datetime.date.fromisoformat(self.date)
+        start = (date - datetime.timedelta(days=self.history_days)).isoformat() if self.history_days is not None else None
+        end = (date - datetime.timedelta(days=1)).isoformat()
+        return start, end
+
     def t_test(self, x_stats, y_stats):
         """
         A customized t-test.
@@ -101,66 +140,89 @@ class FormatVerifier:
         p = 1 - stats.t.cdf(t, df=df) if not np.isnan(t) else np.nan
         return p
 
-    def check_names(self, df):
+    def split_names(self, df, list_features=None):
+        """
+        Returns
+        -------
+        (list, list): Variable names and Value names of the data, see check_names.
         """
-        Checks for any new Variables and Values by comparing them to historical_info file.
+
+        column_names = df.columns.values
+
+        # Split pseudo-categorical variables to get their Variable and Value information.
+        column_names_split = [name.split('_') for name in column_names]
+        variable_names = [name[0] for name in column_names_split if len(name) == 1]
+        value_names = [name[1] for name in column_names_split if len(name) == 2]
+
+        if list_features is not None:
+            value_names.extend(list_features['Value'].astype(str).unique())
+
+        return variable_names, value_names
+
+    def check_names(self, df, list_features=None):
+        """
+        Checks for any new Variables and Values by comparing them to the historical dataset info store.
 
         Some pseudo-categorical (in a sense of possibility of having one than one category in the variable) Variables
         are joined with their Values with an underscore "_" , i.e. Variable_Value, thus these columns are split to
-        check for any new additions in the data.
+        check for any new additions in the data. If these were scraped in the long format, their Values are taken
+        from the list_features table directly instead.
 
         Parameters
         ----------
         df (pandas.DataFrame): consists of data to be checked.
+        list_features (pandas.DataFrame): optional long format list features, see Scraper(list_format='long').
         """
 
-        column_names = df.columns.values
+        variable_names, value_names = self.split_names(df, list_features)
 
-        # Split pseudo-categorical variables to get their Variable and Value information.
-        column_names_split = [name.split('_') for name in column_names]
-        variable_names = [name[0] for name in column_names_split if len(name) == 1]
-        value_names = [name[1] for name in column_names_split if len(name) == 2]
-
-        # Check and report if all of the old variables are present.
+        # Check and report if all of the old, not yet retired, variables are present.
         # Values are not checked because they can vary day-to-day.
-        variable_names_not_found = [name for name in self.historical_info['names']['variable_names'] if
-                                    name not in variable_names]
+        variable_names_not_found = self.registry.missing('variable', variable_names)
 
         if len(variable_names_not_found) > 0:
             logging.warning('Variables expected, but not found in the dataset: {}'.format(variable_names_not_found))
         else:
             logging.info('Found all of the expected Variables.')
 
-        variable_names_new = [name for name in variable_names if
-                              name not in self.historical_info['names']['variable_names']]
-        value_names_new = [name for name in value_names if name not in self.historical_info['names']['value_names']]
+        variable_names_retired = self.registry.retired('variable')
+        if len(variable_names_retired) > 0:
+            logging.info('Variables not seen for over {0} days: {1}'.format(self.registry.retire_days,
+                                                                            variable_names_retired))
+
+        variable_names_new = self.registry.new('variable', variable_names)
+        value_names_new = self.registry.new('value', value_names)
 
         # Report any new Variable/Value names if any were found.
         if len(variable_names_new) > 0:
             logging.warning('Found previously unseen Variables: {}'.format(variable_names_new))
-            self.historical_info['names']['variable_names'].extend(variable_names_new)
         else:
             logging.info('Found no new Variables')
 
         if len(value_names_new) > 0:
             logging.warning('Found previously unseen value names: {}'.format(value_names_new))
-            self.historical_info['names']['value_names'].extend(value_names_new)
         else:
             logging.info('Found no new Values.')
 
+        # Update the first / last seen dates, only the changed names are written to the store.
+        self.registry.observe('variable', variable_names)
+        self.registry.observe('value', value_names)
+        self.registry.save()
+
         pass
 
     def check_types(self, df):
         """
-        Checks if there are any new "object" type variables that were not present in the config file.
+        Checks if there are any new string-like ("object" or "category") type variables that were not present in the
+        config file.
 
         Parameters
         ----------
         df (pandas.DataFrame): consists of data to be checked.
         """
 
-        names_strings = df.select_dtypes('object').columns.values
-        names_strings_unexpected = [name for name in names_strings if name not in self.config['types']['string']]
+        names_strings = df.select_dtypes(include=['object', 'category', 'string']).columns.values
+        names_strings_unexpected = [name for name in names_strings if name not in self.string_types]
 
         if len(names_strings_unexpected) > 0:
             logging.warning(
@@ -169,10 +231,73 @@ class FormatVerifier:
             logging.info('Found no new "ojbect" type variables.')
         pass
 
-    def check_statistics(self, df):
+    def update_statistics(self, df):
+        """
+        Accumulates the statistics of a chunk of data without running any checks. Can be called repeatedly while the
+        scraper streams records, the accumulated statistics are then checked and saved with check_statistics.
+
+        Parameters
+        ----------
+        df (pandas.DataFrame): chunk of data.
+        """
+
+        for variable, chunk_statistics in RunningStatistics.from_frame(df).items():
+            if variable in self.batch_statistics:
+                self.batch_statistics[variable].merge(chunk_statistics)
+            else:
+                # Rows of earlier chunks did not have the variable at all, count them as missing.
+                chunk_statistics.missing += self.batch_samples_total
+                chunk_statistics.samples_total += self.batch_samples_total
+                self.batch_statistics[variable] = chunk_statistics
+
+        # Variables missing from this chunk entirely.
+        for variable in self.batch_statistics.keys():
+            if variable not in df.columns:
+                self.batch_statistics[variable].merge(RunningStatistics(missing=df.shape[0],
+                                                                        samples_total=df.shape[0]))
+
+        for variable, chunk_sketch in QuantileSketch.from_frame(df, k=self.sketch_size).items():
+            if variable in self.batch_sketches:
+                self.batch_sketches[variable].merge(chunk_sketch)
+            else:
+                self.batch_sketches[variable] = chunk_sketch
+
+        self.batch_samples_total += df.shape[0]
+        pass
+
+    def merge_statistics(self, batch_statistics, batch_samples_total, batch_sketches=None):
+        """
+        Merges statistics accumulated elsewhere (e.g. by a parallel worker with its own FormatVerifier) into the
+        current batch.
+
+        Parameters
+        ----------
+        batch_statistics (dict): variable name -> RunningStatistics.
+        batch_samples_total (int): number of rows the statistics were accumulated over.
+        batch_sketches (dict): variable name -> QuantileSketch.
+        """
+
+        for variable in set(self.batch_statistics.keys()) | set(batch_statistics.keys()):
+            current = self.batch_statistics.get(
+                variable, RunningStatistics(missing=self.batch_samples_total, samples_total=self.batch_samples_total))
+            other = batch_statistics.get(
+                variable, RunningStatistics(missing=batch_samples_total, samples_total=batch_samples_total))
+            self.batch_statistics[variable] = current.merge(other)
+
+        for variable, sketch in (batch_sketches or {}).items():
+            if variable in self.batch_sketches:
+                self.batch_sketches[variable].merge(sketch)
+            else:
+                self.batch_sketches[variable] = sketch
+
+        self.batch_samples_total += batch_samples_total
+        pass
+
+    def check_statistics(self, df=None):
         """
         Performs a t-test for variable means where historical information exists as well as checks if the missing
-        value percentage is less than the configuration deviation.
+        value percentage is less than the configuration deviation. Changes in the shape of the distributions are
+        checked by comparing quantile sketches: Kolmogorov-Smirnov distance and relative quantile deviations.
 
         p-value limit and missing value percentage deviation limit can be set in the initialization of this class.
 
@@ -180,101 +305,72 @@ class FormatVerifier:
 
         Parameters
         ----------
-        df (pandas.DataFrame): consists of data to be checked.
+        df (pandas.DataFrame): consists of data to be checked. Optional if the data was already accumulated with
+         update_statistics.
         """
 
-        # Get current batch statistics, add missing value percentage as well as number of samples.
-        statistics = df.select_dtypes(exclude='object').describe().T
-        statistics = statistics[['mean', 'std', 'min', 'max']]
-        statistics['missing'] = df.isna().mean()
-        statistics['samples'] = df.count()
-        statistics['samples_total'] = df.shape[0]
-        statistics['sum'] = df.sum()
-        statistics['sum_squares'] = (df.select_dtypes(exclude='object') ** 2).sum()
+        # Get current batch statistics.
+        if df is not None:
+            self.update_statistics(df)
 
-        # Split variables into ones with historical statistical data and ones without.
-        variables_existing = [name for name in statistics.index.values if
-                              name in self.historical_info['statistics'].keys()]
-        variables_new = [name for name in statistics.index.values if
-                         name not in self.historical_info['statistics'].keys()]
+        statistics = self.batch_statistics
+        sketches = self.batch_sketches
 
-        # Save new variable statistics and report.
-        for variable in variables_new:
-            self.historical_info['statistics'][variable] = statistics.loc[variable].to_dict()
+        # Load the historical statistics of the window preceding the checked date.
+        start, end = self.history_window()
+        historical_statistics = self.store.load_statistics(statistics.keys(), start=start, end=end)
+        historical_sketches = self.store.load_sketches(sketches.keys(), start=start, end=end)
 
-        logging.info('Saved new statistics for Variables: {}'.format(variables_new))
+        # Split variables into ones with historical statistical data and ones without.
+        variables_existing = [name for name in statistics.keys() if name in historical_statistics.keys()]
+        variables_new = [name for name in statistics.keys() if name not in historical_statistics.keys()]
+
+        logging.info('Found no historical statistics for Variables: {}'.format(variables_new))
 
         # Statistical tests.
         variables_failed_test = []
         variables_failed_missing = []
+        variables_failed_distribution = []
+        variables_failed_quantiles = []
         for variable in variables_existing:
 
             # Perform a t-test, add to variables_failed if it failed the test.
-            p_value = self.t_test(self.historical_info['statistics'][variable], statistics.loc[variable].to_dict())
+            p_value = self.t_test(historical_statistics[variable].to_dict(), statistics[variable].to_dict())
             if p_value <= self.p_value:
                 variables_failed_test.append(variable)
 
             # Compare missing values with self.missing_deviation to see if it's more than expected.
-            missing_difference = abs(
-                self.historical_info['statistics'][variable]['missing'] - statistics.loc[variable, 'missing'])
+            missing_difference = abs(historical_statistics[variable].missing_rate - statistics[variable].missing_rate)
             if missing_difference >= self.missing_deviation:
                 variables_failed_missing.append(variable)
 
-            # Update the historical info of existing variables.
-            # Mean, sample sizes.
-            samples_total_new = self.historical_info['statistics'][variable]['samples_total'] + statistics.loc[
-                variable, 'samples_total']
-            samples_new = self.historical_info['statistics'][variable]['samples'] + statistics.loc[variable, 'samples']
-            mean_new = (self.historical_info['statistics'][variable]['mean'] + statistics.loc[
-                variable, 'mean']) / samples_new
-
-            # Update the standard deviation. Source: https://stackoverflow.com/questions/1174984/how-to-efficiently-calculate-a-running-standard-deviation
-            sum_total = statistics.loc[variable, 'sum'] + self.historical_info['statistics'][variable]['sum']
-            sum_total_squares = statistics.loc[variable, 'sum_squares'] + self.historical_info['statistics'][variable][
-                'sum_squares']
-            n_samples = statistics.loc[variable, 'samples'] + statistics.loc[variable, 'samples']
-
-            # Get standard error if sigma is > 0, otherwise set it to nan.
-            sigma = (sum_total_squares / n_samples) - (sum_total / n_samples) ** 2
-            std_new = np.sqrt(sigma) if sigma >= 0 else np.nan
-
-            # Update min and max values.
-            if statistics.loc[variable, 'min'] <= self.historical_info['statistics'][variable]['min']:
-                min_new = statistics.loc[variable, 'min']
-            else:
-                min_new = self.historical_info['statistics'][variable]['min']
+        for variable, sketch in sketches.items():
+            if variable not in historical_sketches.keys():
+                continue
 
-            if statistics.loc[variable, 'max'] >= self.historical_info['statistics'][variable]['max']:
-                max_new = statistics.loc[variable, 'max']
-            else:
-                max_new = self.historical_info['statistics'][variable]['max']
-
-            # Update the missing value percentage.
-            missing_weight_old = self.historical_info['statistics'][variable]['samples_total'] / (
-                        self.historical_info['statistics'][variable]['samples_total'] + statistics.loc[
-                    variable, 'samples_total'])
-            missing_weight_new = statistics.loc[variable, 'samples_total'] / (
-                        self.historical_info['statistics'][variable]['samples_total'] + statistics.loc[
-                    variable, 'samples_total'])
-
-            missing_new = self.historical_info['statistics'][variable]['missing'] * missing_weight_old + statistics.loc[
-                variable, 'missing'] * missing_weight_new
-
-            # Set the updated values to historical_info.
-            self.historical_info['statistics'][variable] = {
-                'std': std_new,
-                'mean': mean_new,
-                'min': min_new,
-                'max': max_new,
-                'missing': missing_new,
-                'samples': samples_new,
-                'samples_total': samples_total_new,
-                'sum': sum_total,
-                'sum_squares': sum_total_squares
-            }
+            # Compare the shapes of the distributions, which can change while keeping the same mean.
+            distance = ks_distance(historical_sketches[variable], sketch)
+            if distance >= self.ks_distance:
+                variables_failed_distribution.append(variable)
+
+            # Quantiles of 0/1 flags only jump between 0 and 1, their drift is covered by the mean and missing checks.
+            if schema.dtype_of(variable) == schema.flag_dtype:
+                continue
+
+            deltas = quantile_deltas(historical_sketches[variable], sketch, self.quantiles)
+            if any(abs(delta) >= self.quantile_deviation for delta in deltas.values()):
+                variables_failed_quantiles.append((variable, deltas))
+
+        # Append the batch to the history as the checked date.
+        self.store.append_day(self.date, statistics, sketches)
+
+        # Statistics are now part of the history, start a new batch.
+        self.batch_statistics = {}
+        self.batch_sketches = {}
+        self.batch_samples_total = 0
 
         # Log the results.
-        logging.info('Updated statistics for all existing Variables.')
+        logging.info('Checked statistics for all existing Variables.')
 
         if len(variables_failed_test) > 0:
             logging.warning(
@@ -293,31 +389,189 @@ class FormatVerifier:
                 'All variables passed the missing value check with missing value percentage deviation of {0}.'.format(
                     self.missing_deviation))
 
-        # Saving the updated historical info into a file.
-        with open('historical_dataset_info.json', 'w') as f:
-            json.dump(self.historical_info, f, cls=NpEncoder)
+        if len(variables_failed_distribution) > 0:
+            logging.warning(
+                'Found Variables that have failed the distribution check with Kolmogorov-Smirnov distance of {0}: {1}.'.format(
+                    self.ks_distance, variables_failed_distribution))
+        else:
+            logging.info(
+                'All variables passed the distribution check with Kolmogorov-Smirnov distance of {0}.'.format(
+                    self.ks_distance))
+
+        if len(variables_failed_quantiles) > 0:
+            logging.warning(
+                'Found Variables that have failed the quantile check with IQR-relative deviation of {0}: {1}.'.format(
+                    self.quantile_deviation, variables_failed_quantiles))
+        else:
+            logging.info(
+                'All variables passed the quantile check with IQR-relative deviation of {0}.'.format(
+                    self.quantile_deviation))
 
-        logging.info('Succesfully updated historical_dataset_info.json file.')
+        logging.info('Succesfully appended {0} statistics to {1}.'.format(self.date, self.store.path))
         pass
 
-    def verify(self, df):
+    def threshold_failures(self, missing, samples, pages=None):
+        """
+        Compares missing value counts against the fail-fast thresholds of config_verifier.json. Nothing fails until
+        there are at least min_samples listings, so a few odd listings at the start of the crawl do not abort it.
+
+        Parameters
+        ----------
+        missing (dict): variable name -> number of listings missing it.
+        samples (int): number of listings.
+        pages (int): number of pages fetched, the listings of which are the ones that were not dead / scraper catchers.
+         The dead page rate is not checked if None.
+
+        Returns
+        -------
+        (list): descriptions of the crossed thresholds, empty if none were crossed.
+        """
+
+        failures = []
+        if (pages is not None) and (pages >= self.thresholds['min_samples']):
+            dead_rate = 1 - samples / pages
+            if dead_rate > self.thresholds['max_dead_rate']:
+                failures.append('{0:.0%} of the pages had no listing data, more than {1:.0%}.'.format(
+                    dead_rate, self.thresholds['max_dead_rate']))
+
+        if samples < self.thresholds['min_samples']:
+            return failures
+
+        for variable, max_missing_rate in self.thresholds['max_missing_rate'].items():
+            missing_rate = missing.get(variable, samples) / samples
+            if missing_rate > max_missing_rate:
+                failures.append('{0:.0%} of the listings are missing {1}, more than {2:.0%}.'.format(
+                    missing_rate, variable, max_missing_rate))
+
+        return failures
+
+    @staticmethod
+    def missing_counts(df, variables):
+        """
+        Returns
+        -------
+        (dict): variable name -> number of rows missing it, all of them if the column is absent.
+        """
+        return {variable: int(df[variable].isna().sum()) if variable in df.columns else df.shape[0]
+                for variable in variables}
+
+    def quarantine(self, df, failures, name):
+        """
+        Saves the data which failed the fail-fast thresholds, along with the failures, for inspection.
+
+        Parameters
+        ----------
+        df (pandas.DataFrame): failed data.
+        failures (list): descriptions of the crossed thresholds.
+        name (str): name of the saved files, without the extension.
+
+        Returns
+        -------
+        (str): path of the saved data.
+        """
+
+        os.makedirs(self.quarantine_directory, exist_ok=True)
+        path = os.path.join(self.quarantine_directory, name + '.pkl')
+        df.to_pickle(path)
+        with open(os.path.join(self.quarantine_directory, name + '.json'), 'w', encoding='utf-8') as f:
+            json.dump({'date': self.date, 'failures': failures, 'samples': self.stream_samples,
+                       'pages': self.stream_pages}, f, indent=2, ensure_ascii=False)
+
+        logging.error('Quarantined {0} listings to {1}: {2}'.format(df.shape[0], path, ' '.join(failures)))
+        return path
+
+    def verify_batch(self, df, list_features=None, pages=None):
+        """
+        Fail-fast checks of a micro-batch of listings, while the scraper is still running, see Scraper.scrape(on_batch).
+
+        Reports previously unseen Variables, Values and string-like types once per run, as soon as they appear, and
+        keeps running missing value counts of the thresholded variables. Once any of the thresholds is crossed, either
+        by the running counts or by the batch alone, the batch is quarantined and the run is aborted. Nothing is written
+        to the historical store, that is only done by the final verify.
+
+        Parameters
+        ----------
+        df (pandas.DataFrame): micro-batch of listings.
+        list_features (pandas.DataFrame): optional long format list features of the batch.
+        pages (int): number of pages fetched for the batch, including the dead ones.
+
+        Raises
+        ------
+        VerificationError: In the case of any of the thresholds being crossed.
+        """
+
+        missing = self.missing_counts(df, self.thresholds['max_missing_rate'].keys())
+        self.stream_batches += 1
+        self.stream_samples += df.shape[0]
+        self.stream_pages += pages if pages is not None else df.shape[0]
+        self.stream_missing.update(missing)
+
+        variable_names, value_names = self.split_names(df, list_features)
+        names_strings = df.select_dtypes(include=['object', 'category', 'string']).columns.values
+        for kind, names in [('Variables', self.registry.new('variable', variable_names)),
+                            ('Values', self.registry.new('value', value_names)),
+                            ('"object" type variables', [name for name in names_strings
+                                                         if name not in self.string_types])]:
+            names = [name for name in names if (kind, name) not in self.stream_reported]
+            if len(names) > 0:
+                logging.warning('Found previously unseen {0} in batch {1}: {2}'.format(kind, self.stream_batches, names))
+                self.stream_reported.update((kind, name) for name in names)
+
+        # The batch on its own catches breakages in the middle of the crawl, long before the running counts would.
+        failures = self.threshold_failures(self.stream_missing, self.stream_samples,
+                                           self.stream_pages if pages is not None else None) or \
+            self.threshold_failures(missing, df.shape[0], pages)
+        if len(failures) > 0:
+            self.quarantine(df, failures, '{0}_batch_{1}'.format(self.date, self.stream_batches))
+            raise VerificationError(' '.join(failures))
+        pass
+
+    def verify(self, df, list_features=None):
         """
         Performs all the verification checks in the class for a given dataset.
 
         Currently, these are:
+         * the fail-fast thresholds, over the whole dataset.
          * check_names()
          * check_types()
          * check_statistics()
 
+        The data should only be published once this passes. Data crossing the thresholds is quarantined and does not
+        become a part of the history.
+
         Parameters
         ----------
         df (pandas.DataFrame): consists of data to be checked.
+        list_features (pandas.DataFrame): optional long format list features, see Scraper(list_format='long').
+
+        Raises
+        ------
+        VerificationError: In the case of any of the thresholds being crossed.
         """
 
         logging.info('Executing data checks.')
-        self.check_names(df)
-        self.check_types(df)
-        self.check_statistics(df)
+        self.profiler.start()
+
+        # The profile is dumped for failed runs as well, those are the ones worth looking into.
+        try:
+            # Pages are only known if the data was streamed through verify_batch.
+            with self.profiler.span('check_thresholds'):
+                failures = self.threshold_failures(
+                    self.missing_counts(df, self.thresholds['max_missing_rate'].keys()), df.shape[0],
+                    self.stream_pages if self.stream_batches > 0 else None)
+            if len(failures) > 0:
+                self.quarantine(df, failures, self.date)
+                raise VerificationError(' '.join(failures))
+
+            with self.profiler.span('check_names'):
+                self.check_names(df, list_features)
+            with self.profiler.span('check_types'):
+                self.check_types(df)
+            with self.profiler.span('check_statistics'):
+                self.check_statistics(df)
+        finally:
+            self.profiler.dump()
+
         logging.info('Successfully executed all the data checks.')
 
         pass
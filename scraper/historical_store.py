@@ -0,0 +1,586 @@
+import os
+import json
+import datetime
+import zlib
+import sqlite3
+import logging
+
+import numpy as np
+import pandas as pd
+
+from running_statistics import RunningStatistics
+from quantile_sketch import QuantileSketch
+
+
+# Date under which the statistics of the older, collapsed historical_dataset_info.json format are stored.
+LEGACY_DATE = '0001-01-01'
+
+# Above this many variables, rows are filtered after the query instead, SQLite limits the number of parameters.
+MAX_QUERY_VARIABLES = 500
+
+
+class HistoricalStore:
+    def __init__(self, path='historical_dataset_info.db', legacy_path='historical_dataset_info.json'):
+        """
+        Append-only SQLite store of the historical dataset information used by FormatVerifier.
+
+        Every verified day appends one row of statistics and one quantile sketch per variable, so any window of days
+        can be aggregated (or a bad day removed) without rewriting the whole history. Aggregation of the moments is
+        done within SQLite.
+
+        Windows without a start date (the whole history) are served from a cumulative row of statistics and a cumulative
+        sketch per variable instead, merged with every appended day, so their load time stays flat as the number of
+        days grows. Cumulative rows of variables with a replaced or deleted day are rebuilt from their daily rows.
+
+        Parameters
+        ----------
+        path (str): path of the SQLite database file.
+        legacy_path (str): path of the older json file, imported once if the database is empty.
+        """
+
+        self.path = path
+        self.connection = sqlite3.connect(path)
+
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS statistics (
+                    date TEXT NOT NULL,
+                    variable TEXT NOT NULL,
+                    samples INTEGER NOT NULL,
+                    mean REAL NOT NULL,
+                    m2 REAL NOT NULL,
+                    min REAL,
+                    max REAL,
+                    missing_count INTEGER NOT NULL,
+                    samples_total INTEGER NOT NULL,
+                    PRIMARY KEY (variable, date)
+                );
+                CREATE INDEX IF NOT EXISTS statistics_date ON statistics (date);
+
+                CREATE TABLE IF NOT EXISTS sketches (
+                    date TEXT NOT NULL,
+                    variable TEXT NOT NULL,
+                    sketch BLOB NOT NULL,
+                    PRIMARY KEY (variable, date)
+                );
+                CREATE INDEX IF NOT EXISTS sketches_date ON sketches (date);
+
+                CREATE TABLE IF NOT EXISTS cumulative_statistics (
+                    variable TEXT PRIMARY KEY,
+                    last_date TEXT NOT NULL,
+                    samples INTEGER NOT NULL,
+                    mean REAL NOT NULL,
+                    m2 REAL NOT NULL,
+                    min REAL,
+                    max REAL,
+                    missing_count INTEGER NOT NULL,
+                    samples_total INTEGER NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS cumulative_sketches (
+                    variable TEXT PRIMARY KEY,
+                    last_date TEXT NOT NULL,
+                    sketch BLOB NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS names (
+                    kind TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    first_seen TEXT NOT NULL,
+                    last_seen TEXT NOT NULL,
+                    PRIMARY KEY (kind, name)
+                );
+            """)
+
+        if (legacy_path is not None) and os.path.exists(legacy_path) and self.is_empty():
+            self.import_legacy(legacy_path)
+        pass
+
+    def is_empty(self):
+        """
+        Returns
+        -------
+        (bool): whether the store has no statistics and no names.
+        """
+        statistics = self.connection.execute('SELECT COUNT(*) FROM statistics').fetchone()[0]
+        names = self.connection.execute('SELECT COUNT(*) FROM names').fetchone()[0]
+        return statistics + names == 0
+
+    def import_legacy(self, legacy_path):
+        """
+        Imports the older historical_dataset_info.json format. Its collapsed statistics are stored under LEGACY_DATE,
+        while its names count as seen today.
+
+        Parameters
+        ----------
+        legacy_path (str): path of the json file.
+        """
+
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            historical_info = json.load(f)
+
+        today = datetime.date.today().isoformat()
+        self.add_names('variable', historical_info.get('names', {}).get('variable_names', []), date=today)
+        self.add_names('value', historical_info.get('names', {}).get('value_names', []), date=today)
+
+        statistics = {variable: RunningStatistics.from_dict(data) for variable, data in
+                      historical_info.get('statistics', {}).items()}
+        sketches = {variable: QuantileSketch.from_dict(data) for variable, data in
+                    historical_info.get('sketches', {}).items()}
+        self.append_day(LEGACY_DATE, statistics, sketches)
+
+        logging.info('Imported {0} into {1}.'.format(legacy_path, self.path))
+        pass
+
+    def append_day(self, date, statistics, sketches=None):
+        """
+        Appends the statistics of a single day and merges them into the cumulative rows. Appending the same day again
+        replaces all of its rows.
+
+        Parameters
+        ----------
+        date (str): ISO formatted date, e.g. '2020-05-01'.
+        statistics (dict): variable name -> RunningStatistics.
+        sketches (dict): variable name -> QuantileSketch.
+        """
+
+        sketches = sketches or {}
+
+        with self.connection:
+            # Cumulative rows which already include this day would count it twice, they are rebuilt instead.
+            replaced_statistics = self.delete_rows('statistics', date)
+            replaced_sketches = self.delete_rows('sketches', date)
+
+            self.connection.executemany('INSERT INTO statistics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                        [(date, variable) + self.statistics_row(s)
+                                         for variable, s in statistics.items()])
+            self.connection.executemany('INSERT INTO sketches VALUES (?, ?, ?)',
+                                        [(date, variable, self.compress(sketch))
+                                         for variable, sketch in sketches.items()])
+
+            # Every variable with daily rows has a cumulative row, so variables without one are new.
+            cumulative = self.cumulative_statistics(statistics.keys())
+            rows = []
+            for variable, s in statistics.items():
+                if variable in replaced_statistics:
+                    continue
+                if variable in cumulative:
+                    rows.append((variable, max(cumulative[variable][1], date)) +
+                                self.statistics_row(cumulative[variable][0].merge(s)))
+                else:
+                    rows.append((variable, date) + self.statistics_row(s))
+            self.insert_cumulative('statistics', rows)
+            self.rebuild_cumulative('statistics', replaced_statistics)
+
+            cumulative = self.cumulative_sketches(sketches.keys())
+            rows = []
+            for variable, sketch in sketches.items():
+                if variable in replaced_sketches:
+                    continue
+                if variable in cumulative:
+                    cumulative[variable][0].merge(sketch)
+                    rows.append((variable, max(cumulative[variable][1], date), self.compress(cumulative[variable][0])))
+                else:
+                    rows.append((variable, date, self.compress(sketch)))
+            self.insert_cumulative('sketches', rows)
+            self.rebuild_cumulative('sketches', replaced_sketches)
+        pass
+
+    def delete_day(self, date):
+        """
+        Removes all of the statistics of a given day, e.g. to roll back a bad scrape.
+
+        Parameters
+        ----------
+        date (str): ISO formatted date.
+        """
+
+        with self.connection:
+            for table in ['statistics', 'sketches']:
+                self.rebuild_cumulative(table, self.delete_rows(table, date))
+        pass
+
+    def delete_rows(self, table, date):
+        """
+        Deletes the daily rows of a day from the statistics or the sketches table, without committing.
+
+        Returns
+        -------
+        (set): variables which had a row on that day.
+        """
+
+        variables = {row[0] for row in self.connection.execute(
+            'SELECT variable FROM {} WHERE date = ?'.format(table), (date,))}
+        self.connection.execute('DELETE FROM {} WHERE date = ?'.format(table), (date,))
+        return variables
+
+    @staticmethod
+    def to_sql(value):
+        """
+        SQLite has no nan, store it as NULL.
+        """
+        return None if (value is None) or np.isnan(value) else float(value)
+
+    def statistics_row(self, s):
+        """
+        Returns
+        -------
+        (tuple): samples, mean, m2, min, max, missing_count and samples_total columns of a RunningStatistics.
+        """
+        return s.count, s.mean, s.m2, self.to_sql(s.minimum), self.to_sql(s.maximum), s.missing, s.samples_total
+
+    @staticmethod
+    def compress(sketch):
+        return zlib.compress(json.dumps(sketch.to_dict()).encode('utf-8'))
+
+    @staticmethod
+    def decompress(blob):
+        return QuantileSketch.from_dict(json.loads(zlib.decompress(blob).decode('utf-8')))
+
+    def cumulative_statistics(self, variables=None):
+        """
+        Parameters
+        ----------
+        variables (iterable): variables to load, all if None.
+
+        Returns
+        -------
+        (dict): variable name -> (RunningStatistics, last date) of the existing cumulative rows.
+        """
+
+        variables = set(variables) if variables is not None else None
+
+        statistics = {}
+        for variable, last_date, samples, mean, m2, minimum, maximum, missing, samples_total in \
+                self.connection.execute('SELECT * FROM cumulative_statistics'):
+            if (variables is None) or (variable in variables):
+                statistics[variable] = (RunningStatistics(
+                    count=samples,
+                    mean=mean,
+                    m2=m2,
+                    minimum=minimum if minimum is not None else np.nan,
+                    maximum=maximum if maximum is not None else np.nan,
+                    missing=missing,
+                    samples_total=samples_total
+                ), last_date)
+        return statistics
+
+    def cumulative_sketches(self, variables=None):
+        """
+        Parameters
+        ----------
+        variables (iterable): variables to load, all if None.
+
+        Returns
+        -------
+        (dict): variable name -> (QuantileSketch, last date) of the existing cumulative rows.
+        """
+
+        variables = set(variables) if variables is not None else None
+        return {variable: (self.decompress(blob), last_date) for variable, last_date, blob in
+                self.connection.execute('SELECT * FROM cumulative_sketches')
+                if (variables is None) or (variable in variables)}
+
+    def cumulative_methods(self, table):
+        """
+        Returns
+        -------
+        (callable, callable, callable): daily row aggregation, cumulative row loading and cumulative row encoding of the
+         statistics or the sketches table.
+        """
+
+        if table == 'statistics':
+            return self.aggregate_statistics, self.cumulative_statistics, self.statistics_row
+        return self.merge_sketches, self.cumulative_sketches, lambda sketch: (self.compress(sketch),)
+
+    def insert_cumulative(self, table, rows):
+        """
+        Inserts or replaces cumulative rows of the statistics or the sketches table, without committing.
+        """
+
+        if len(rows) > 0:
+            self.connection.executemany('INSERT OR REPLACE INTO cumulative_{0} VALUES ({1})'.format(
+                table, ', '.join('?' * len(rows[0]))), rows)
+        pass
+
+    def rebuild_cumulative(self, table, variables):
+        """
+        Recomputes the cumulative rows of the given variables from their daily rows, without committing. Variables
+        without any daily rows left lose their cumulative row.
+
+        Parameters
+        ----------
+        table (str): 'statistics' or 'sketches'.
+        variables (iterable): variable names.
+        """
+
+        variables = list(variables)
+        if len(variables) == 0:
+            return
+
+        aggregate, _, encode = self.cumulative_methods(table)
+        self.connection.executemany('DELETE FROM cumulative_{} WHERE variable = ?'.format(table),
+                                    [(variable,) for variable in variables])
+
+        # A primary key lookup per variable.
+        last_dates = {variable: self.connection.execute(
+            'SELECT MAX(date) FROM {} WHERE variable = ?'.format(table), (variable,)).fetchone()[0]
+            for variable in variables}
+        self.insert_cumulative(table, [(variable, last_dates[variable]) + encode(value)
+                                       for variable, value in aggregate(variables).items()])
+        pass
+
+    def load_cumulative(self, table, variables=None, start=None, end=None):
+        """
+        Loads the statistics or the sketches of an inclusive date window, see load_statistics and load_sketches.
+        """
+
+        aggregate, load, _ = self.cumulative_methods(table)
+        if (start is not None) or ((variables is not None) and (len(variables) == 0)):
+            return aggregate(variables, start, end)
+
+        cumulative = load(variables)
+        requested = list(variables) if variables is not None else list(cumulative.keys())
+
+        # Variables with days after the end of the window (or unknown ones) are aggregated from the daily rows.
+        values = {variable: value for variable, (value, last_date) in cumulative.items()
+                  if (end is None) or (last_date <= end)}
+        remaining = [variable for variable in requested if variable not in values]
+        if len(remaining) > 0:
+            values.update(aggregate(remaining, start, end))
+
+        return {variable: values[variable] for variable in requested if variable in values}
+
+    @staticmethod
+    def window(variables=None, start=None, end=None):
+        """
+        Builds a WHERE clause for the given variables and an inclusive date window.
+
+        Returns
+        -------
+        (str, list): clause and its parameters.
+        """
+
+        variables = list(variables) if variables is not None else None
+
+        conditions = []
+        parameters = []
+        if (variables is not None) and (len(variables) <= MAX_QUERY_VARIABLES):
+            conditions.append('variable IN ({})'.format(', '.join('?' * len(variables))))
+            parameters.extend(variables)
+        if start is not None:
+            conditions.append('date >= ?')
+            parameters.append(start)
+        if end is not None:
+            conditions.append('date <= ?')
+            parameters.append(end)
+
+        clause = 'WHERE ' + ' AND '.join(conditions) if len(conditions) > 0 else ''
+        return clause, parameters
+
+    def load_statistics(self, variables=None, start=None, end=None):
+        """
+        Aggregates the daily statistics over an inclusive date window. Windows without a start date are served from the
+        cumulative rows, except for the variables with days after the end of the window.
+
+        Parameters
+        ----------
+        variables (list): variables to load, all if None.
+        start (str): first ISO formatted date of the window, unbounded if None.
+        end (str): last ISO formatted date of the window, unbounded if None.
+
+        Returns
+        -------
+        (dict): variable name -> RunningStatistics.
+        """
+
+        return self.load_cumulative('statistics', variables, start, end)
+
+    def aggregate_statistics(self, variables=None, start=None, end=None):
+        """
+        Aggregates the daily statistics over an inclusive date window.
+
+        Means and M2 are combined with the parallel variant of Welford's algorithm, all within a single query.
+
+        Parameters
+        ----------
+        variables (list): variables to load, all if None.
+        start (str): first ISO formatted date of the window, unbounded if None.
+        end (str): last ISO formatted date of the window, unbounded if None.
+
+        Returns
+        -------
+        (dict): variable name -> RunningStatistics.
+        """
+
+        if (variables is not None) and (len(variables) == 0):
+            return {}
+
+        clause, parameters = self.window(variables, start, end)
+        query = """
+            WITH days AS (SELECT * FROM statistics {}),
+            totals AS (
+                SELECT variable,
+                       SUM(samples) AS samples,
+                       COALESCE(SUM(samples * mean) / NULLIF(SUM(samples), 0), 0) AS mean,
+                       MIN(min) AS min,
+                       MAX(max) AS max,
+                       SUM(missing_count) AS missing_count,
+                       SUM(samples_total) AS samples_total
+                FROM days GROUP BY variable
+            )
+            SELECT totals.variable, totals.samples, totals.mean,
+                   SUM(days.m2 + days.samples * (days.mean - totals.mean) * (days.mean - totals.mean)),
+                   totals.min, totals.max, totals.missing_count, totals.samples_total
+            FROM days JOIN totals ON days.variable = totals.variable
+            GROUP BY totals.variable
+        """.format(clause)
+
+        statistics = {}
+        for variable, samples, mean, m2, minimum, maximum, missing, samples_total in \
+                self.connection.execute(query, parameters):
+            statistics[variable] = RunningStatistics(
+                count=samples,
+                mean=mean,
+                m2=m2,
+                minimum=minimum if minimum is not None else np.nan,
+                maximum=maximum if maximum is not None else np.nan,
+                missing=missing,
+                samples_total=samples_total
+            )
+
+        if variables is not None:
+            statistics = {variable: statistics[variable] for variable in variables if variable in statistics}
+        return statistics
+
+    def load_sketches(self, variables=None, start=None, end=None):
+        """
+        Merges the daily quantile sketches over an inclusive date window. Windows without a start date are served from
+        the cumulative sketches, except for the variables with days after the end of the window.
+
+        Parameters
+        ----------
+        variables (list): variables to load, all if None.
+        start (str): first ISO formatted date of the window, unbounded if None.
+        end (str): last ISO formatted date of the window, unbounded if None.
+
+        Returns
+        -------
+        (dict): variable name -> QuantileSketch.
+        """
+
+        return self.load_cumulative('sketches', variables, start, end)
+
+    def merge_sketches(self, variables=None, start=None, end=None):
+        """
+        Merges the daily quantile sketches over an inclusive date window.
+
+        Parameters
+        ----------
+        variables (list): variables to load, all if None.
+        start (str): first ISO formatted date of the window, unbounded if None.
+        end (str): last ISO formatted date of the window, unbounded if None.
+
+        Returns
+        -------
+        (dict): variable name -> QuantileSketch.
+        """
+
+        if (variables is not None) and (len(variables) == 0):
+            return {}
+
+        clause, parameters = self.window(variables, start, end)
+        query = 'SELECT variable, sketch FROM sketches {} ORDER BY date'.format(clause)
+
+        variables = set(variables) if variables is not None else None
+
+        sketches = {}
+        for variable, blob in self.connection.execute(query, parameters):
+            if (variables is not None) and (variable not in variables):
+                continue
+
+            sketch = self.decompress(blob)
+            if variable in sketches:
+                sketches[variable].merge(sketch)
+            else:
+                sketches[variable] = sketch
+        return sketches
+
+    def daily_statistics(self, variable, start=None, end=None):
+        """
+        Time series of a single variable's daily statistics.
+
+        Parameters
+        ----------
+        variable (str): variable name.
+        start (str): first ISO formatted date of the window, unbounded if None.
+        end (str): last ISO formatted date of the window, unbounded if None.
+
+        Returns
+        -------
+        pandas.DataFrame: one row per day, indexed by date.
+        """
+
+        clause, parameters = self.window([variable], start, end)
+        query = 'SELECT * FROM statistics {} ORDER BY date'.format(clause)
+
+        df = pd.read_sql_query(query, self.connection, params=parameters, index_col='date')
+        df['std'] = np.sqrt(df['m2'] / (df['samples'] - 1).where(df['samples'] > 1))
+        df['missing'] = df['missing_count'] / df['samples_total']
+        return df
+
+    def dates(self):
+        """
+        Returns
+        -------
+        (list): ISO formatted dates present in the store.
+        """
+        return [row[0] for row in self.connection.execute('SELECT DISTINCT date FROM statistics ORDER BY date')]
+
+    def load_names(self, kind):
+        """
+        Parameters
+        ----------
+        kind (str): 'variable' or 'value'.
+
+        Returns
+        -------
+        (dict): name -> [first_seen, last_seen] ISO formatted dates, for all names of the given kind.
+        """
+
+        query = 'SELECT name, first_seen, last_seen FROM names WHERE kind = ?'
+        return {name: [first_seen, last_seen] for name, first_seen, last_seen in self.connection.execute(query, (kind,))}
+
+    def add_names(self, kind, names, date):
+        """
+        Parameters
+        ----------
+        kind (str): 'variable' or 'value'.
+        names (list): names to add, existing ones are ignored.
+        date (str): ISO formatted date the names were first and last seen at.
+        """
+
+        with self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO names VALUES (?, ?, ?, ?)',
+                                        [(kind, name, date, date) for name in names])
+        pass
+
+    def upsert_names(self, kind, names):
+        """
+        Inserts or updates the first_seen / last_seen dates of the given names.
+
+        Parameters
+        ----------
+        kind (str): 'variable' or 'value'.
+        names (dict): name -> [first_seen, last_seen] ISO formatted dates.
+        """
+
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?)',
+                                        [(kind, name, first_seen, last_seen) for name, (first_seen, last_seen) in
+                                         names.items()])
+        pass
+
+    def close(self):
+        self.connection.close()
+        pass
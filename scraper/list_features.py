@@ -0,0 +1,163 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import schema
+
+
+class ListFeatureVocabulary:
+    def __init__(self, path='list_feature_vocabulary.json'):
+        """
+        Stable, append-only vocabulary of the pseudo-categorical list feature values, e.g. Ypatybes_Balkonas.
+
+        Every Variable_Value pair gets an integer id the first time it is seen, which never changes afterwards, so
+        one-hot matrices built on different days share the same column order.
+
+        Parameters
+        ----------
+        path (str): path of the json file the vocabulary is persisted to, in-memory only if None.
+        """
+
+        self.path = path
+
+        if (path is not None) and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.tokens = json.load(f)
+        else:
+            self.tokens = []
+
+        self.ids = {token: i for i, token in enumerate(self.tokens)}
+        pass
+
+    @staticmethod
+    def token(variable, value):
+        return variable + '_' + value
+
+    def add(self, long_df):
+        """
+        Adds any previously unseen Variable_Value pairs to the vocabulary.
+
+        Parameters
+        ----------
+        long_df (pandas.DataFrame): long format list features with Variable and Value columns.
+
+        Returns
+        -------
+        (list): newly added tokens.
+        """
+
+        tokens_new = []
+        for variable, value in long_df[['Variable', 'Value']].drop_duplicates().itertuples(index=False):
+            token = self.token(variable, value)
+            if token not in self.ids:
+                self.ids[token] = len(self.tokens)
+                self.tokens.append(token)
+                tokens_new.append(token)
+        return tokens_new
+
+    def save(self):
+        if self.path is not None:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.tokens, f, ensure_ascii=False)
+        pass
+
+    def __len__(self):
+        return len(self.tokens)
+
+
+def explode(listing_url, object_data, variables):
+    """
+    Pops the list variables from a processed listing and returns them as long format rows.
+
+    Parameters
+    ----------
+    listing_url (str): url identifying the listing.
+    object_data (dict): processed listing, list variables are removed from it in place.
+    variables (list): names of the list variables.
+
+    Returns
+    -------
+    (list): (ListingUrl, Variable, Value) rows.
+    """
+
+    rows = []
+    for variable in variables:
+        for value in object_data.pop(variable, []):
+            rows.append((listing_url, variable, value))
+    return rows
+
+
+def to_long(rows):
+    """
+    Builds the long format list feature table.
+
+    Parameters
+    ----------
+    rows (list): (ListingUrl, Variable, Value) rows, e.g. from explode.
+
+    Returns
+    -------
+    pandas.DataFrame: one row per listing feature, with categorical Variable and Value columns.
+    """
+
+    long_df = pd.DataFrame(rows, columns=['ListingUrl', 'Variable', 'Value']).drop_duplicates()
+    long_df['Variable'] = long_df['Variable'].astype('category')
+    long_df['Value'] = long_df['Value'].astype('category')
+    return long_df.reset_index(drop=True)
+
+
+def to_sparse(long_df, listing_urls, vocabulary):
+    """
+    Builds a sparse one-hot matrix of the list features with a stable column order.
+
+    Parameters
+    ----------
+    long_df (pandas.DataFrame): long format list features.
+    listing_urls (array-like): listing urls of the rows, e.g. the ListingUrl column of the main DataFrame.
+    vocabulary (ListFeatureVocabulary): vocabulary defining the columns, updated with any new values.
+
+    Returns
+    -------
+    pandas.DataFrame: sparse uint8 Variable_Value columns indexed by listing url.
+    """
+
+    vocabulary.add(long_df)
+
+    listing_urls = pd.Index(listing_urls)
+    rows = listing_urls.get_indexer(long_df['ListingUrl'])
+    columns = np.array([vocabulary.ids[vocabulary.token(variable, value)] for variable, value in
+                        long_df[['Variable', 'Value']].itertuples(index=False)], dtype=np.int64)
+
+    # Features of listings that are not in listing_urls are ignored.
+    present = rows >= 0
+    matrix = sparse.coo_matrix((np.ones(present.sum(), dtype=np.uint8), (rows[present], columns[present])),
+                               shape=(len(listing_urls), len(vocabulary))).tocsc()
+
+    return pd.DataFrame.sparse.from_spmatrix(matrix, index=listing_urls, columns=vocabulary.tokens)
+
+
+def to_wide(df, long_df):
+    """
+    Joins the list features back onto the main DataFrame as dense Variable_Value 0/1 flag columns, the same format as
+    produced by Scraper(list_format='wide').
+
+    Parameters
+    ----------
+    df (pandas.DataFrame): main DataFrame with a ListingUrl column.
+    long_df (pandas.DataFrame): long format list features.
+
+    Returns
+    -------
+    pandas.DataFrame: main DataFrame with the list feature columns, of schema.flag_dtype.
+    """
+
+    tokens = long_df['Variable'].astype(str) + '_' + long_df['Value'].astype(str)
+    wide = pd.crosstab(long_df['ListingUrl'], tokens).clip(upper=1)
+    wide.columns.name = None
+
+    df = df.join(wide, on='ListingUrl')
+    df[wide.columns] = df[wide.columns].fillna(0).astype(schema.flag_dtype)
+    return df
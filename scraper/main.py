@@ -1,23 +1,54 @@
 from scraper import Scraper
-from format_verifier import FormatVerifier
-from flask import Flask, request
+from format_verifier import FormatVerifier, VerificationError
+from estimator import Estimator
+from feature_export import FeatureExporter
+from flask import Flask, request, jsonify
 
 
 if __name__ == '__main__':
 
     app = Flask(__name__)
+    estimator = Estimator()
 
 
     @app.route('/scrape', methods=['POST', 'GET'])
     def scrape():
-        scraper = Scraper()
+        scraper = Scraper(list_format='long', deduplicate=True, schedule=True, store_descriptions=True,
+                          archive=True)
         verifier = FormatVerifier()
 
-        df = scraper.scrape()
+        # Micro-batches are verified while scraping, so a broken parser aborts the run early. The whole day is verified
+        # before anything is recorded. Failed data is quarantined and never replaces the published tables.
+        try:
+            df = scraper.scrape(on_batch=verifier.verify_batch, verify=verifier.verify)
+        except VerificationError as e:
+            return jsonify({'error': 'Verification failed: {}'.format(e)}), 500
+
         # TODO: Save daily data, if_exists=replace. Add timestamp. Ways to automatically add column names?
         df.to_gbq('rent_avm.raw_listings', project_id='rent-avm', if_exists='replace', progress_bar=False)
+        scraper.list_features.astype(str).to_gbq('rent_avm.raw_listing_features', project_id='rent-avm',
+                                                 if_exists='replace', progress_bar=False)
+
+        # Append the day to the feature matrices used for retraining, only the listings crawled on the day.
+        FeatureExporter().export(scraper.crawled, list_features=scraper.crawled_list_features)
 
-        verifier.verify(df)
+        # Serve estimates from the freshly scraped listings.
+        estimator.update(df)
         return 'Success'
 
-    app.run(host='localhost', port=8080, debug=False)
\ No newline at end of file
+
+    @app.route('/estimate', methods=['POST'])
+    def estimate():
+        """
+        Estimates the rent of a single listing (a JSON object) or a batch of them (a JSON list), e.g.
+        {"Plotas": 50, "KambariuSk": 2, "Metai": 1985, "Aukstas": 3, "BuildingCity": "Vilnius",
+         "BuildingNeighbourhood": "Žirmūnai"}
+        """
+        try:
+            return jsonify(estimator.estimate(request.get_json(force=True)))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except RuntimeError as e:
+            return jsonify({'error': str(e)}), 503
+
+    app.run(host='localhost', port=8080, debug=False, threaded=True)
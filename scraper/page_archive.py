@@ -0,0 +1,200 @@
+import os
+import gzip
+import sqlite3
+import logging
+import datetime
+
+
+class PageArchive:
+    def __init__(self, directory='archive', retention_days=90, level=6, batch_size=100):
+        """
+        Rolling archive of the rendered page sources of the scraped listings, so they can be re-extracted offline (see
+        reprocess.py) instead of re-scraped.
+
+        Similarly to WARC.gz files, every day is a single file of concatenated gzip members, one per page, each with a
+        short header (URL, Date, Content-Length) followed by the page source. A SQLite index maps (date, url) to the
+        offset and length of the member, so any page can be read without decompressing the rest of the day, and the
+        pages of a day are read back in the order they were crawled. Days older than retention_days are pruned.
+
+        Parameters
+        ----------
+        directory (str): directory of the daily files and of the index.
+        retention_days (int): number of days to keep, None to keep everything.
+        level (int): gzip compression level.
+        batch_size (int): number of pages written before the index is committed.
+        """
+
+        self.directory = directory
+        self.retention_days = retention_days
+        self.level = level
+        self.batch_size = batch_size
+        os.makedirs(directory, exist_ok=True)
+
+        self.file = None
+        self.file_date = None
+        self.pending = []
+
+        self.connection = sqlite3.connect(os.path.join(directory, 'index.db'))
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    date TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL,
+                    PRIMARY KEY (date, url)
+                );
+                CREATE INDEX IF NOT EXISTS pages_url ON pages (url);
+            """)
+        pass
+
+    def path(self, date):
+        """
+        Returns
+        -------
+        (str): path of the file of the given day.
+        """
+        return os.path.join(self.directory, date + '.pages.gz')
+
+    def put(self, url, html, date=None):
+        """
+        Appends a page to the file of the day. The index is committed every batch_size pages and on flush.
+
+        Parameters
+        ----------
+        url (str): listing url.
+        html (str): rendered page source.
+        date (str): ISO formatted date of the crawl, today if None.
+        """
+
+        date = date if date is not None else datetime.date.today().isoformat()
+        if date != self.file_date:
+            self.flush()
+            if self.file is not None:
+                self.file.close()
+            self.file = open(self.path(date), 'ab')
+            self.file_date = date
+
+        content = html.encode('utf-8')
+        header = 'URL: {0}\nDate: {1}\nContent-Length: {2}\n\n'.format(url, date, len(content)).encode('utf-8')
+        record = gzip.compress(header + content, compresslevel=self.level)
+
+        offset = self.file.tell()
+        self.file.write(record)
+        self.pending.append((date, url, offset, len(record)))
+
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        pass
+
+    def flush(self):
+        """
+        Writes the pending pages to disk, then commits their index entries, so the index never points past the data.
+        A url archived twice on the same day points to its latest page.
+        """
+
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+        if len(self.pending) > 0:
+            with self.connection:
+                self.connection.executemany('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)', self.pending)
+            self.pending = []
+        pass
+
+    @staticmethod
+    def read(path, offset, length):
+        """
+        Reads a single page of a daily file.
+
+        Returns
+        -------
+        (str, str): listing url and page source.
+        """
+
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            record = gzip.decompress(f.read(length))
+
+        header, content = record.split(b'\n\n', 1)
+        url = header.split(b'\n', 1)[0][len(b'URL: '):].decode('utf-8')
+        return url, content.decode('utf-8')
+
+    def get(self, url, date=None):
+        """
+        Parameters
+        ----------
+        url (str): listing url.
+        date (str): ISO formatted date, the latest page archived on or before it is returned. Latest overall if None.
+
+        Returns
+        -------
+        (str): page source, None if the url is not archived.
+        """
+
+        self.flush()
+        row = self.connection.execute(
+            'SELECT date, offset, length FROM pages WHERE url = ? AND date <= ? ORDER BY date DESC LIMIT 1',
+            (url, date if date is not None else '9999-12-31')).fetchone()
+        if row is None:
+            return None
+        return self.read(self.path(row[0]), row[1], row[2])[1]
+
+    def entries(self, date):
+        """
+        Returns
+        -------
+        (list): (url, offset, length) of the pages of a day, in the order they were crawled.
+        """
+
+        self.flush()
+        return self.connection.execute('SELECT url, offset, length FROM pages WHERE date = ? ORDER BY offset',
+                                       (date,)).fetchall()
+
+    def dates(self, start=None, end=None):
+        """
+        Returns
+        -------
+        (list): ISO formatted dates of the archived days within an inclusive window, unbounded sides if None.
+        """
+
+        self.flush()
+        return [row[0] for row in self.connection.execute(
+            'SELECT DISTINCT date FROM pages WHERE date >= ? AND date <= ? ORDER BY date',
+            (start if start is not None else '', end if end is not None else '9999-12-31'))]
+
+    def prune(self, today=None):
+        """
+        Removes the days older than retention_days.
+
+        Parameters
+        ----------
+        today (str): ISO formatted date the retention is counted from, today if None.
+        """
+
+        if self.retention_days is None:
+            return
+
+        today = datetime.date.fromisoformat(today) if today is not None else datetime.date.today()
+        cutoff = (today - datetime.timedelta(days=self.retention_days)).isoformat()
+
+        dates = [date for date in self.dates() if date < cutoff]
+        with self.connection:
+            self.connection.execute('DELETE FROM pages WHERE date < ?', (cutoff,))
+        for date in dates:
+            if os.path.exists(self.path(date)):
+                os.remove(self.path(date))
+
+        if len(dates) > 0:
+            logging.info('Pruned {0} archived days older than {1}.'.format(len(dates), cutoff))
+        pass
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.file_date = None
+        self.connection.close()
+        pass
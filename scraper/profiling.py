@@ -0,0 +1,244 @@
+import os
+import sys
+import json
+import time
+import heapq
+import logging
+import threading
+import contextlib
+from collections import defaultdict, Counter
+
+
+class Profiler:
+    def __init__(self, name, enabled=True, directory='profiles', sample_interval=0.01, top_n=20):
+        """
+        Opt-in profiler of the scraping and verification runs.
+
+        Records timing spans of the stages (e.g. fetch, render, parse, process) per url, keeps the top-N slowest urls
+        along with their page source, and samples the call stack of the profiled thread in the background. The
+        samples are labeled with the current stage and dumped in the collapsed stack format, which can be turned
+        into a flamegraph with e.g. flamegraph.pl or speedscope. Durations measured outside of Python, such as the
+        browser's fetch and render times, are added with record.
+
+        When disabled, all of the methods are no-ops, so they can be left in the code.
+
+        Parameters
+        ----------
+        name (str): name of the profiled run, used as the prefix of the dumped files.
+        enabled (bool): whether to profile at all.
+        directory (str): directory the results are dumped into.
+        sample_interval (float): seconds between two stack samples.
+        top_n (int): number of the slowest urls to keep.
+        """
+
+        self.name = name
+        self.enabled = enabled
+        self.directory = directory
+        self.sample_interval = sample_interval
+        self.top_n = top_n
+
+        self.stage_totals = defaultdict(float)
+        self.stage_counts = defaultdict(int)
+        self.stages = []
+        self.nested_times = []
+
+        self.current_url = None
+        self.url_spans = None
+        self.url_html = None
+        self.url_count = 0
+        self.slowest_urls = []
+
+        self.samples = Counter()
+        self.sampler = None
+        self.stop_sampling = threading.Event()
+        self.thread_id = None
+        pass
+
+    def start(self):
+        """
+        Starts sampling the call stack of the calling thread.
+        """
+
+        if not self.enabled or self.sampler is not None:
+            return
+
+        self.thread_id = threading.get_ident()
+        self.stop_sampling.clear()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+        pass
+
+    def sample(self):
+        """
+        Sampling loop, runs in a background thread.
+        """
+
+        while not self.stop_sampling.wait(self.sample_interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{0} ({1}:{2})'.format(code.co_name, os.path.basename(code.co_filename),
+                                                    code.co_firstlineno))
+                frame = frame.f_back
+
+            stage = self.stages[-1] if len(self.stages) > 0 else 'other'
+            self.samples[';'.join([self.name, stage] + stack[::-1])] += 1
+        pass
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        """
+        Times a stage, e.g. with profiler.span('fetch'): ...
+
+        Spans can be nested, a stage is only attributed the time not spent in its nested stages.
+
+        Parameters
+        ----------
+        stage (str): name of the stage.
+        """
+
+        if not self.enabled:
+            yield
+            return
+
+        self.stages.append(stage)
+        self.nested_times.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            total = time.perf_counter() - start
+            elapsed = total - self.nested_times.pop()
+            self.stages.pop()
+            if len(self.nested_times) > 0:
+                self.nested_times[-1] += total
+
+            self.stage_totals[stage] += elapsed
+            self.stage_counts[stage] += 1
+            if self.url_spans is not None:
+                self.url_spans[stage] = self.url_spans.get(stage, 0) + elapsed
+        pass
+
+    def record(self, stage, seconds):
+        """
+        Attributes a duration measured elsewhere (e.g. by the browser) to a stage. Within a span, the duration is taken
+        out of the span's own time, same as a nested span.
+
+        Parameters
+        ----------
+        stage (str): name of the stage.
+        seconds (float): duration of the stage.
+        """
+
+        if not self.enabled:
+            return
+
+        if len(self.nested_times) > 0:
+            self.nested_times[-1] += seconds
+
+        self.stage_totals[stage] += seconds
+        self.stage_counts[stage] += 1
+        if self.url_spans is not None:
+            self.url_spans[stage] = self.url_spans.get(stage, 0) + seconds
+        pass
+
+    @contextlib.contextmanager
+    def url(self, url):
+        """
+        Times everything done for a single url, keeping it if it is among the top-N slowest.
+
+        Parameters
+        ----------
+        url (str): url being processed.
+        """
+
+        if not self.enabled:
+            yield
+            return
+
+        self.current_url = url
+        self.url_spans = {}
+        self.url_html = None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.url_count += 1
+
+            # The count breaks ties, so the entries never compare by their spans.
+            entry = (elapsed, self.url_count, url, self.url_spans, self.url_html)
+
+            # Min-heap of the slowest urls, the fastest of them is replaced first.
+            if len(self.slowest_urls) < self.top_n:
+                heapq.heappush(self.slowest_urls, entry)
+            elif elapsed > self.slowest_urls[0][0]:
+                heapq.heapreplace(self.slowest_urls, entry)
+
+            self.current_url = None
+            self.url_spans = None
+            self.url_html = None
+        pass
+
+    def record_html(self, html):
+        """
+        Attaches the page source to the url currently being processed, saved if the url ends up among the slowest.
+
+        Parameters
+        ----------
+        html (str): page source.
+        """
+
+        if self.enabled and (self.current_url is not None):
+            self.url_html = html
+        pass
+
+    def dump(self):
+        """
+        Stops sampling and writes the results into self.directory:
+         * <name>_stages.json - total time and count of every stage.
+         * <name>_slowest_urls.json - the slowest urls with their stage timings, and their page sources as
+           <name>_slow_<rank>.html.
+         * <name>.collapsed - stack samples in the collapsed format, for flamegraphs.
+        """
+
+        if not self.enabled:
+            return
+
+        if self.sampler is not None:
+            self.stop_sampling.set()
+            self.sampler.join()
+            self.sampler = None
+
+        os.makedirs(self.directory, exist_ok=True)
+        prefix = os.path.join(self.directory, self.name)
+
+        stages = {stage: {'seconds': self.stage_totals[stage], 'count': self.stage_counts[stage]}
+                  for stage in sorted(self.stage_totals, key=self.stage_totals.get, reverse=True)}
+        with open(prefix + '_stages.json', 'w', encoding='utf-8') as f:
+            json.dump(stages, f, indent=2)
+
+        slowest_urls = []
+        for rank, (elapsed, _, url, spans, html) in enumerate(sorted(self.slowest_urls, reverse=True)):
+            html_path = None
+            if html is not None:
+                html_path = '{0}_slow_{1}.html'.format(prefix, rank)
+                with open(html_path, 'w', encoding='utf-8') as f:
+                    f.write(html)
+            slowest_urls.append({'url': url, 'seconds': elapsed, 'stages': spans, 'html': html_path})
+
+        with open(prefix + '_slowest_urls.json', 'w', encoding='utf-8') as f:
+            json.dump(slowest_urls, f, indent=2, ensure_ascii=False)
+
+        with open(prefix + '.collapsed', 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.items():
+                f.write('{0} {1}\n'.format(stack, count))
+
+        logging.info('Profile of {0}: {1}'.format(self.name, ', '.join(
+            '{0} {1:.1f}s'.format(stage, values['seconds']) for stage, values in stages.items())))
+        logging.info('Dumped the profile of {0} to {1}.'.format(self.name, self.directory))
+        pass
@@ -0,0 +1,295 @@
+import numpy as np
+
+import schema
+
+
+class QuantileSketch:
+    def __init__(self, k=200):
+        """
+        Compact, mergeable quantile sketch of a single numeric column (KLL sketch).
+
+        Values are kept in a hierarchy of compactors, where an item at level h stands for 2^h original values. Once a
+        level is over its capacity, it is sorted and every other item is promoted to the next level. Memory stays
+        around 3k items no matter how many values were seen, while the rank error stays around 1.7 / k.
+
+        Sources:
+            [1] Karnin, Lang, Liberty. Optimal Quantile Approximation in Streams. https://arxiv.org/abs/1603.05346
+
+        Parameters
+        ----------
+        k (int): size of the largest compactor, controls the accuracy and the memory of the sketch.
+        """
+
+        self.k = k
+        self.levels = [[]]
+        self.count = 0
+        self.minimum = np.nan
+        self.maximum = np.nan
+
+    def capacity(self, level):
+        """
+        Capacity of a given level. Higher levels get larger capacities, the top one being of size k.
+        """
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def compress(self):
+        """
+        Compacts the levels which exceed their capacity until the sketch fits into its memory budget.
+        """
+
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) > self.capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+
+                items = sorted(self.levels[level])
+
+                # An odd item out stays at the current level, so that the weights are preserved exactly.
+                leftover = [items.pop()] if len(items) % 2 == 1 else []
+                offset = np.random.randint(2)
+
+                self.levels[level + 1].extend(items[offset::2])
+                self.levels[level] = leftover
+            level += 1
+        pass
+
+    def update(self, values):
+        """
+        Updates the sketch with a chunk of values, missing values are ignored.
+
+        Parameters
+        ----------
+        values (array-like): chunk of values, e.g. a pandas.Series column of a scraped batch.
+
+        Returns
+        -------
+        self
+        """
+
+        if hasattr(values, 'to_numpy'):
+            values = values.to_numpy(dtype=float, na_value=np.nan)
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+
+        if values.size == 0:
+            return self
+
+        self.count += values.size
+        self.minimum = np.fmin(self.minimum, values.min())
+        self.maximum = np.fmax(self.maximum, values.max())
+
+        # Feed the values in slices of the bottom level capacity, to keep the peak memory bounded as well.
+        step = self.capacity(0)
+        for start in range(0, values.size, step):
+            self.levels[0].extend(values[start:start + step].tolist())
+            self.compress()
+
+        return self
+
+    def merge(self, other):
+        """
+        Merges another sketch into this one in place.
+
+        Parameters
+        ----------
+        other (QuantileSketch): sketch to merge in.
+
+        Returns
+        -------
+        self
+        """
+
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+
+        self.count += other.count
+        self.minimum = np.fmin(self.minimum, other.minimum)
+        self.maximum = np.fmax(self.maximum, other.maximum)
+
+        self.compress()
+        return self
+
+    def weighted_items(self):
+        """
+        Returns
+        -------
+        (numpy.ndarray, numpy.ndarray): sorted retained items and their weights.
+        """
+
+        items = np.concatenate([np.asarray(items, dtype=float) for items in self.levels])
+        weights = np.concatenate([np.full(len(items), 2 ** level, dtype=float) for level, items in
+                                  enumerate(self.levels)])
+
+        order = np.argsort(items, kind='mergesort')
+        return items[order], weights[order]
+
+    def cdf(self, x):
+        """
+        Approximate share of values less than or equal to x.
+
+        Parameters
+        ----------
+        x (float or array-like): points to evaluate at.
+
+        Returns
+        -------
+        (float or numpy.ndarray): approximate cumulative distribution at x.
+        """
+
+        items, weights = self.weighted_items()
+        if items.size == 0:
+            return np.full(np.shape(x), np.nan) if np.ndim(x) > 0 else np.nan
+
+        cumulative = np.concatenate([[0.0], np.cumsum(weights)]) / weights.sum()
+        return cumulative[np.searchsorted(items, x, side='right')]
+
+    def quantile(self, q):
+        """
+        Approximate q-th quantile of the values.
+
+        Parameters
+        ----------
+        q (float or array-like): quantiles in the range of [0, 1].
+
+        Returns
+        -------
+        (float or numpy.ndarray): approximate quantile values.
+        """
+
+        items, weights = self.weighted_items()
+        if items.size == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) > 0 else np.nan
+
+        cumulative = np.cumsum(weights) / weights.sum()
+        index = np.minimum(np.searchsorted(cumulative, q, side='left'), items.size - 1)
+        return items[index]
+
+    def histogram(self, bins):
+        """
+        Approximate histogram of the values.
+
+        Parameters
+        ----------
+        bins (array-like): bin edges.
+
+        Returns
+        -------
+        (numpy.ndarray): approximate number of values in each bin.
+        """
+        return np.diff(self.cdf(np.asarray(bins, dtype=float))) * self.count
+
+    def to_dict(self):
+        """
+        Returns
+        -------
+        (dict): json serializable sketch state.
+        """
+        return {
+            'k': self.k,
+            'levels': self.levels,
+            'count': self.count,
+            'min': self.minimum,
+            'max': self.maximum
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Deserializes a sketch saved with to_dict.
+
+        Parameters
+        ----------
+        data (dict): serialized sketch.
+
+        Returns
+        -------
+        QuantileSketch
+        """
+
+        sketch = cls(k=data['k'])
+        sketch.levels = [list(items) for items in data['levels']]
+        sketch.count = data['count']
+        sketch.minimum = data['min']
+        sketch.maximum = data['max']
+        return sketch
+
+    @classmethod
+    def from_frame(cls, df, k=200):
+        """
+        Builds sketches for all of the numeric columns of a DataFrame, except for the identifiers of schema.py.
+
+        Parameters
+        ----------
+        df (pandas.DataFrame): chunk of data.
+        k (int): size of the largest compactor.
+
+        Returns
+        -------
+        (dict): column name -> QuantileSketch.
+        """
+        return {name: cls(k=k).update(df[name]) for name in df.select_dtypes(include='number').columns.values
+                if name not in schema.variables_identifiers}
+
+    def __repr__(self):
+        return 'QuantileSketch(count={0}, items={1})'.format(self.count, sum(len(items) for items in self.levels))
+
+
+def ks_distance(x_sketch, y_sketch):
+    """
+    Approximate two sample Kolmogorov-Smirnov distance, i.e. the largest difference between the cumulative
+    distributions of the two sketches.
+
+    Parameters
+    ----------
+    x_sketch (QuantileSketch): first sketch.
+    y_sketch (QuantileSketch): second sketch.
+
+    Returns
+    -------
+    (float): distance in the range of [0, 1], nan if either of the sketches is empty.
+    """
+
+    if (x_sketch.count == 0) or (y_sketch.count == 0):
+        return np.nan
+
+    # The largest difference is attained at one of the retained items.
+    points = np.union1d(x_sketch.weighted_items()[0], y_sketch.weighted_items()[0])
+    return float(np.max(np.abs(x_sketch.cdf(points) - y_sketch.cdf(points))))
+
+
+def quantile_deltas(x_sketch, y_sketch, quantiles):
+    """
+    Differences of the given quantiles between two sketches, scaled by the interquartile range of the reference,
+    (y - x) / IQR(x). Unlike differences relative to the quantiles themselves, these are well defined for quantiles of 0
+    and are not inflated on small integer variables (e.g. a floor number going from 2 to 3).
+
+    The range of the reference is used if its IQR is 0, and no scaling at all if it is constant.
+
+    Parameters
+    ----------
+    x_sketch (QuantileSketch): reference sketch.
+    y_sketch (QuantileSketch): compared sketch.
+    quantiles (list): quantiles in the range of [0, 1].
+
+    Returns
+    -------
+    (dict): quantile -> scaled difference.
+    """
+
+    x_quantiles = x_sketch.quantile(quantiles)
+    y_quantiles = y_sketch.quantile(quantiles)
+
+    x_q25, x_q75, x_min, x_max = x_sketch.quantile([0.25, 0.75, 0, 1])
+    scale = x_q75 - x_q25
+    if not scale > 0:
+        scale = x_max - x_min
+    if not scale > 0:
+        scale = 1.0
+
+    deltas = (y_quantiles - x_quantiles) / scale
+    return dict(zip(quantiles, deltas.tolist()))
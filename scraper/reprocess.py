@@ -0,0 +1,151 @@
+"""
+Offline re-extraction of the archived listing pages (see page_archive.py), e.g. after fixing config_scraper.json or
+Scraper.process_object_data, without re-scraping the website.
+
+Every archived day is extracted and processed across all cores with the same Scraper methods as a live run, in the
+original crawl order, and saved as <output>/<date>.pkl (and <date>.list_features.pkl with the long list format).
+
+Usage: python reprocess.py start_date [end_date] [--processes N] [--output reprocessed] [--verify]
+"""
+import os
+import argparse
+import logging
+import multiprocessing
+
+from bs4 import BeautifulSoup
+
+from scraper import Scraper
+from page_archive import PageArchive
+from format_verifier import FormatVerifier
+
+
+# Scraper of a worker process, created once per process by init_worker.
+worker_scraper = None
+
+
+def init_worker(list_format):
+    global worker_scraper
+    worker_scraper = Scraper(verbose=False, list_format=list_format, offline=True)
+    pass
+
+
+def extract_chunk(chunk):
+    """
+    Extracts and processes a chunk of archived pages within a worker process.
+
+    Parameters
+    ----------
+    chunk (tuple): path of the daily archive file and a list of (url, offset, length) of its pages.
+
+    Returns
+    -------
+    (list, list): processed object data and (ListingUrl, Variable, Value) rows of the listings.
+    """
+
+    path, entries = chunk
+
+    records = []
+    list_feature_rows = []
+    for url, offset, length in entries:
+        try:
+            _, page_source = PageArchive.read(path, offset, length)
+            listing_data = worker_scraper.extract_object_data(BeautifulSoup(page_source, 'lxml'), url)
+            if listing_data is None:
+                continue
+
+            object_data, object_list_feature_rows = worker_scraper.process_listing(listing_data)
+            records.append(object_data)
+            list_feature_rows.extend(object_list_feature_rows)
+
+        except Exception as e:
+            logging.warning('Failed to reprocess {0}: {1}'.format(url, e))
+
+    return records, list_feature_rows
+
+
+def verify_day(df, list_features, date):
+    """
+    Verifies a reprocessed day with a FormatVerifier of that date, so its statistics and names are stored under it.
+    """
+
+    verifier = FormatVerifier(date=date)
+    try:
+        verifier.verify(df, list_features)
+    finally:
+        verifier.store.close()
+    pass
+
+
+def reprocess(start=None, end=None, processes=None, list_format='long', deduplicate=True, store_descriptions=True,
+              chunk_size=50, verify=None):
+    """
+    Re-extracts the archived days of an inclusive date window.
+
+    Parameters
+    ----------
+    start (str): first ISO formatted date, unbounded if None.
+    end (str): last ISO formatted date, unbounded if None.
+    processes (int): number of worker processes, all of the cores if None.
+    list_format (str): see Scraper.
+    deduplicate (bool): see Scraper.
+    store_descriptions (bool): see Scraper.
+    chunk_size (int): number of pages sent to a worker at once.
+    verify (callable): called with the listings, the list features and the ISO formatted date of every day, before
+     the day is recorded in the near-duplicate index and the description store, e.g. verify_day. Should raise if the
+     day must not be recorded.
+
+    Returns
+    -------
+    (generator): (date, DataFrame, list features DataFrame or None) per archived day, same as Scraper.scrape and
+     Scraper.list_features of a live run on that day.
+    """
+
+    scraper = Scraper(list_format=list_format, deduplicate=deduplicate, store_descriptions=store_descriptions,
+                      offline=True)
+    archive = PageArchive(**scraper.config['archive'])
+
+    with multiprocessing.Pool(processes, initializer=init_worker, initargs=(list_format,)) as pool:
+        for date in archive.dates(start, end):
+            path = archive.path(date)
+            entries = archive.entries(date)
+            chunks = [(path, entries[i:i + chunk_size]) for i in range(0, len(entries), chunk_size)]
+
+            # imap keeps the order of the chunks, so the rows are in the order of the live run.
+            records = []
+            list_feature_rows = []
+            for chunk_records, chunk_list_feature_rows in pool.imap(extract_chunk, chunks):
+                records.extend(chunk_records)
+                list_feature_rows.extend(chunk_list_feature_rows)
+
+            df = scraper.build_frame(records, list_feature_rows)
+            if verify is not None:
+                verify(df, scraper.list_features, date)
+
+            df = scraper.postprocess(df, date)
+            logging.info('Reprocessed {0} listings out of {1} archived pages of {2}.'.format(
+                df.shape[0], len(entries), date))
+            yield date, df, scraper.list_features
+
+    archive.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-extracts the archived listing pages of a date range.')
+    parser.add_argument('start', help='first ISO formatted date')
+    parser.add_argument('end', nargs='?', default=None, help='last ISO formatted date, the start date if omitted')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes, all cores if omitted')
+    parser.add_argument('--output', default='reprocessed', help='output directory')
+    parser.add_argument('--verify', action='store_true', help='verify every day, see format_verifier.py')
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    for date, df, list_features in reprocess(args.start, args.end if args.end is not None else args.start,
+                                             args.processes, verify=verify_day if args.verify else None):
+        df.to_pickle(os.path.join(args.output, date + '.pkl'))
+        if list_features is not None:
+            list_features.to_pickle(os.path.join(args.output, date + '.list_features.pkl'))
+    pass
+
+
+if __name__ == '__main__':
+    main()
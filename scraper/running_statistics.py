@@ -0,0 +1,197 @@
+import numpy as np
+
+import schema
+
+
+class RunningStatistics:
+    def __init__(self, count=0, mean=0.0, m2=0.0, minimum=np.nan, maximum=np.nan, missing=0, samples_total=0):
+        """
+        Mergeable accumulator of a single column's statistics.
+
+        Mean and variance are kept using Welford's algorithm (count, mean, M2), which, unlike sums of squares, stays
+        numerically stable on large values and long histories. Accumulators can be updated chunk by chunk and merged
+        across workers using the parallel variant of the algorithm.
+
+        Sources:
+            [1] https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Parallel_algorithm
+
+        Parameters
+        ----------
+        count (int): number of non-missing values seen.
+        mean (float): mean of the non-missing values seen.
+        m2 (float): sum of squared differences from the mean.
+        minimum (float): smallest value seen.
+        maximum (float): largest value seen.
+        missing (int): number of missing values seen.
+        samples_total (int): number of values seen, including missing ones.
+        """
+
+        self.count = int(count)
+        self.mean = float(mean)
+        self.m2 = float(m2)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.missing = int(missing)
+        self.samples_total = int(samples_total)
+
+    @property
+    def std(self):
+        """
+        Sample standard deviation, nan if less than two values were seen.
+        """
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+    @property
+    def missing_rate(self):
+        """
+        Share of missing values, nan if nothing was seen.
+        """
+        return self.missing / self.samples_total if self.samples_total > 0 else np.nan
+
+    def update(self, values):
+        """
+        Updates the accumulator with a chunk of values. Missing values (None, nan) are counted, but not used for the
+        moments.
+
+        Parameters
+        ----------
+        values (array-like): chunk of values, e.g. a pandas.Series column of a scraped batch.
+
+        Returns
+        -------
+        self
+        """
+
+        # Nullable pandas types (e.g. Int16) need an explicit missing value to be cast into floats.
+        if hasattr(values, 'to_numpy'):
+            values = values.to_numpy(dtype=float, na_value=np.nan)
+        values = np.asarray(values, dtype=float).ravel()
+        present = values[~np.isnan(values)]
+
+        chunk = RunningStatistics(
+            count=present.size,
+            mean=present.mean() if present.size > 0 else 0.0,
+            m2=((present - present.mean()) ** 2).sum() if present.size > 0 else 0.0,
+            minimum=present.min() if present.size > 0 else np.nan,
+            maximum=present.max() if present.size > 0 else np.nan,
+            missing=values.size - present.size,
+            samples_total=values.size
+        )
+        return self.merge(chunk)
+
+    def merge(self, other):
+        """
+        Merges another accumulator into this one in place.
+
+        Parameters
+        ----------
+        other (RunningStatistics): accumulator to merge in.
+
+        Returns
+        -------
+        self
+        """
+
+        count = self.count + other.count
+        if count > 0:
+            delta = other.mean - self.mean
+            self.mean = self.mean + delta * other.count / count
+            self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / count
+
+        self.count = count
+        self.minimum = np.fmin(self.minimum, other.minimum)
+        self.maximum = np.fmax(self.maximum, other.maximum)
+        self.missing += other.missing
+        self.samples_total += other.samples_total
+        return self
+
+    def copy(self):
+        """
+        Returns
+        -------
+        RunningStatistics: an independent copy of the accumulator.
+        """
+        return RunningStatistics.from_dict(self.to_dict())
+
+    def to_dict(self):
+        """
+        Serializes the accumulator. Besides the state itself, derived values used by FormatVerifier.t_test (samples,
+        std, mean) and the missing value percentage are stored as well.
+
+        Returns
+        -------
+        (dict): json serializable accumulator state.
+        """
+        return {
+            'samples': self.count,
+            'mean': self.mean,
+            'm2': self.m2,
+            'std': self.std,
+            'min': self.minimum,
+            'max': self.maximum,
+            'missing': self.missing_rate,
+            'missing_count': self.missing,
+            'samples_total': self.samples_total
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Deserializes an accumulator saved with to_dict.
+
+        Also loads the older historical_dataset_info.json format, which only had mean, std, missing percentage and
+        sums. M2 and the missing value count are then recovered from the standard deviation and the percentage.
+
+        Parameters
+        ----------
+        data (dict): serialized accumulator.
+
+        Returns
+        -------
+        RunningStatistics
+        """
+
+        count = data.get('samples', 0)
+        samples_total = data.get('samples_total', count)
+
+        if 'm2' in data:
+            m2 = data['m2']
+        else:
+            std = data.get('std', np.nan)
+            m2 = std ** 2 * (count - 1) if (count > 1) and not np.isnan(std) else 0.0
+
+        if 'missing_count' in data:
+            missing = data['missing_count']
+        else:
+            missing_rate = data.get('missing', 0.0)
+            missing = round(missing_rate * samples_total) if not np.isnan(missing_rate) else 0
+
+        return cls(
+            count=count,
+            mean=data.get('mean', 0.0) if count > 0 else 0.0,
+            m2=m2,
+            minimum=data.get('min', np.nan),
+            maximum=data.get('max', np.nan),
+            missing=missing,
+            samples_total=samples_total
+        )
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Builds accumulators for all of the numeric columns of a DataFrame, except for the identifiers of schema.py.
+
+        Parameters
+        ----------
+        df (pandas.DataFrame): chunk of data.
+
+        Returns
+        -------
+        (dict): column name -> RunningStatistics.
+        """
+        return {name: cls().update(df[name]) for name in df.select_dtypes(include='number').columns.values
+                if name not in schema.variables_identifiers}
+
+    def __repr__(self):
+        return 'RunningStatistics(samples={0}, mean={1:.4g}, std={2:.4g}, missing={3})'.format(
+            self.count, self.mean, self.std, self.missing)
@@ -0,0 +1,252 @@
+import sqlite3
+import logging
+import datetime
+
+import os
+import numpy as np
+import pandas as pd
+
+import schema
+
+
+class RevisitScheduler:
+    def __init__(self, path='listing_schedule.db', daily_request_budget=2000, min_revisit_days=1, max_revisit_days=14,
+                 prior_changes=1, prior_days=7, views_scale=50, dead_retry_share=0.1,
+                 snapshot_path='listing_snapshot.pkl'):
+        """
+        Decides which listing detail pages to fetch on a given day, within a daily request budget.
+
+        Brand-new listings are always crawled first. The rest are prioritized by the probability of having changed
+        since their last visit, 1 - exp(-rate * days since the last visit), where the change rate is estimated per
+        listing from its history of price edits, smoothed towards a prior for listings with little history. Listings
+        gaining views quickly are likely to change (or be rented out) soon, so their rate is scaled up by their view
+        velocity (ListingViewsTotal). Listings not visited for max_revisit_days are revisited regardless. Dead pages
+        (and scraper catchers) are recorded as well, and only retried every max_revisit_days, after everything else.
+        At most dead_retry_share of the budget goes to dead retries, spread evenly through the crawl, so that they
+        neither cross the dead page rate thresholds of a verified micro-batch nor all fall due on the same days.
+
+        Since only a part of the listings is crawled every day, the latest known row of every listing is kept in a
+        snapshot, into which every crawl is merged, see merge_snapshot.
+
+        Sources:
+            [1] Cho, Garcia-Molina. Estimating Frequency of Change. http://oak.cs.ucla.edu/~cho/papers/cho-tois03.pdf
+
+        Parameters
+        ----------
+        path (str): path of the SQLite database with the visit history.
+        daily_request_budget (int): maximum number of listing pages fetched per day.
+        min_revisit_days (int): listings visited more recently than this are not revisited.
+        max_revisit_days (int): listings not visited for this long are revisited first, after the new ones.
+        prior_changes (float): prior number of changes, for smoothing the change rate.
+        prior_days (float): prior number of observed days, for smoothing the change rate.
+        views_scale (float): views per day which double the change rate.
+        dead_retry_share (float): maximum share of the daily budget spent on retrying dead pages.
+        snapshot_path (str): path of the snapshot of the latest known rows of the listings.
+        """
+
+        self.daily_request_budget = daily_request_budget
+        self.min_revisit_days = min_revisit_days
+        self.max_revisit_days = max_revisit_days
+        self.prior_changes = prior_changes
+        self.prior_days = prior_days
+        self.views_scale = views_scale
+        self.dead_retry_share = dead_retry_share
+        self.snapshot_path = snapshot_path
+
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS listings (
+                    url TEXT PRIMARY KEY,
+                    first_seen TEXT NOT NULL,
+                    last_visit TEXT NOT NULL,
+                    visits INTEGER NOT NULL,
+                    changes INTEGER NOT NULL,
+                    observed_days INTEGER NOT NULL,
+                    price REAL,
+                    views_total REAL,
+                    views_per_day REAL,
+                    dead INTEGER NOT NULL
+                );
+            """)
+        pass
+
+    def history(self):
+        """
+        Returns
+        -------
+        pandas.DataFrame: visit history indexed by url.
+        """
+        return pd.read_sql_query('SELECT * FROM listings', self.connection, index_col='url')
+
+    def priorities(self, history, date):
+        """
+        Parameters
+        ----------
+        history (pandas.DataFrame): visit history indexed by url, see history.
+        date (str): ISO formatted date of the crawl.
+
+        Returns
+        -------
+        pandas.Series: probability of every listing having changed since its last visit, negative if it should not be
+         revisited yet. Dead pages due for a retry get 0, the lowest priority.
+        """
+
+        days_since_visit = (pd.Timestamp(date) - pd.to_datetime(history['last_visit'])).dt.days
+        rate = (history['changes'].astype(float) + self.prior_changes) / \
+               (history['observed_days'].astype(float) + self.prior_days)
+        rate = rate * (1 + history['views_per_day'].astype(float).fillna(0).clip(lower=0) / self.views_scale)
+
+        priority = 1 - np.exp(-rate * days_since_visit)
+        priority[days_since_visit < self.min_revisit_days] = -1
+        priority[days_since_visit >= self.max_revisit_days] = 1 + days_since_visit
+
+        dead = history['dead'].astype(bool)
+        priority[dead] = np.where(days_since_visit[dead] >= self.max_revisit_days, 0, -1)
+        return priority
+
+    def schedule(self, listing_urls, date=None):
+        """
+        Picks the listing urls to crawl.
+
+        Parameters
+        ----------
+        listing_urls (list): urls of all the currently listed listings, as returned by Scraper.get_urls.
+        date (str): ISO formatted date of the crawl, today if None.
+
+        Returns
+        -------
+        (list): urls to crawl, new ones first, then in the order of their priority, with the dead retries spread
+         evenly between them.
+        """
+
+        date = date if date is not None else datetime.date.today().isoformat()
+        listing_urls = list(dict.fromkeys(listing_urls))
+
+        history = self.history()
+        urls_new = [url for url in listing_urls if url not in history.index]
+        urls_known = history.index.intersection(pd.Index(listing_urls))
+
+        priority = self.priorities(history.loc[urls_known], date)
+        priority = priority[priority >= 0].sort_values(ascending=False, kind='mergesort')
+
+        # Dead retries have the lowest priority, so they only take what is left of the budget.
+        dead = history.loc[priority.index, 'dead'].astype(bool)
+        urls = (urls_new + priority.index[~dead.values].tolist())[:self.daily_request_budget]
+        retries = priority.index[dead.values].tolist()[:min(int(self.daily_request_budget * self.dead_retry_share),
+                                                            self.daily_request_budget - len(urls))]
+
+        # One retry every len(urls) / len(retries) urls.
+        positions = [int((i + 1) * len(urls) / (len(retries) + 1)) for i in range(len(retries))]
+        urls = np.insert(np.array(urls, dtype=object), positions, retries).tolist()
+
+        revisits = max(len(urls) - len(retries) - len(urls_new), 0)
+        logging.info('Scheduled {0} out of {1} listings: {2} new, {3} revisits, {4} dead retries, budget {5}.'.format(
+            len(urls), len(listing_urls), len(urls) - len(retries) - revisits, revisits, len(retries),
+            self.daily_request_budget))
+        return urls
+
+    def update(self, df, listing_urls=None, date=None):
+        """
+        Records the visits of the crawled listings, counting the price edits and the view velocity. Crawled urls
+        without a listing in df are recorded as dead pages.
+
+        Parameters
+        ----------
+        df (pandas.DataFrame): crawled listings with ListingUrl, KainaMen and ListingViewsTotal columns.
+        listing_urls (list): all of the crawled urls, including the dead ones. Only the ones in df if None.
+        date (str): ISO formatted date of the crawl, today if None.
+        """
+
+        date = date if date is not None else datetime.date.today().isoformat()
+        history = self.history()
+
+        visits = df.reindex(columns=['ListingUrl', 'KainaMen', 'ListingViewsTotal'])
+        visits['dead'] = False
+        if listing_urls is not None:
+            dead = pd.Index(listing_urls).unique().difference(pd.Index(visits['ListingUrl']))
+            visits = pd.concat([visits, pd.DataFrame({'ListingUrl': dead, 'dead': True})], ignore_index=True)
+
+        rows = []
+        for url, price, views, dead in visits.itertuples(index=False):
+            price = None if pd.isna(price) else float(price)
+            views = None if pd.isna(views) else float(views)
+
+            if url not in history.index:
+                rows.append((url, date, date, 1, 0, 0, price, views, None, int(dead)))
+                continue
+
+            old = history.loc[url]
+            days = max((pd.Timestamp(date) - pd.Timestamp(old['last_visit'])).days, 0)
+            if days == 0:
+                continue
+
+            # Dead pages keep the last known price and views.
+            if dead:
+                price = None if pd.isna(old['price']) else float(old['price'])
+                views = None if pd.isna(old['views_total']) else float(old['views_total'])
+
+            changed = (price is not None) and not pd.isna(old['price']) and (price != old['price'])
+            views_per_day = (views - old['views_total']) / days if (views is not None) and \
+                not pd.isna(old['views_total']) and not dead else old['views_per_day']
+
+            rows.append((url, old['first_seen'], date, int(old['visits']) + 1, int(old['changes']) + int(changed),
+                         int(old['observed_days']) + days, price, views,
+                         None if pd.isna(views_per_day) else float(views_per_day), int(dead)))
+
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        pass
+
+    def merge_snapshot(self, df, listing_urls, crawled_urls, list_features=None):
+        """
+        Merges a crawl into the snapshot of the latest known rows of the listings and saves it.
+
+        Crawled listings replace their previous rows. Listings which were not crawled keep their previous rows, as long
+        as they are still listed, while crawled urls which turned out dead and listings no longer listed are dropped.
+
+        Parameters
+        ----------
+        df (pandas.DataFrame): crawled listings.
+        listing_urls (list): urls of all the currently listed listings, as returned by Scraper.get_urls.
+        crawled_urls (list): urls crawled, as returned by schedule.
+        list_features (pandas.DataFrame): optional long format list features of the crawled listings.
+
+        Returns
+        -------
+        (pandas.DataFrame, pandas.DataFrame): latest known rows of all of the listed listings, and their long format
+         list features (None if list_features is None).
+        """
+
+        if os.path.exists(self.snapshot_path):
+            snapshot = pd.read_pickle(self.snapshot_path)
+        else:
+            snapshot = {'listings': pd.DataFrame(columns=['ListingUrl']), 'list_features': None}
+
+        previous = snapshot['listings']
+        previous_urls = previous['ListingUrl'] if 'ListingUrl' in previous.columns else pd.Series(dtype=object)
+        keep = previous_urls.isin(pd.Index(listing_urls)) & ~previous_urls.isin(pd.Index(crawled_urls))
+        kept_urls = pd.Index(previous_urls[keep])
+
+        frames = [frame for frame in [df, previous[keep.values]] if frame.shape[0] > 0]
+        listings = schema.apply_schema(pd.concat(frames, ignore_index=True)) if len(frames) > 0 else df
+
+        merged_features = None
+        if list_features is not None:
+            frames = [list_features]
+            if snapshot['list_features'] is not None:
+                previous_features = snapshot['list_features']
+                frames.append(previous_features[previous_features['ListingUrl'].isin(kept_urls)])
+            merged_features = pd.concat([frame.astype({'Variable': str, 'Value': str}) for frame in frames],
+                                        ignore_index=True)
+            merged_features = merged_features.astype({'Variable': 'category', 'Value': 'category'})
+
+        pd.to_pickle({'listings': listings, 'list_features': merged_features}, self.snapshot_path)
+
+        logging.info('Merged {0} crawled listings with {1} previously crawled ones, {2} in total.'.format(
+            df.shape[0], len(kept_urls), listings.shape[0]))
+        return listings, merged_features
+
+    def close(self):
+        self.connection.close()
+        pass
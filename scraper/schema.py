@@ -0,0 +1,128 @@
+import logging
+
+import pandas as pd
+import unidecode
+
+
+# Variables as named after the key transformations in Scraper.process_object_data, before removing the Lithuanian
+# characters.
+variables_integer = ['Plotas', 'KainaMėn', 'KambariųSk', 'Aukštas', 'AukštųSk', 'Metai', 'ArtimiausiasDarželis',
+                     'ArtimiausiaMokymoĮstaiga', 'ArtimiausiaParduotuvė', 'ViešojoTransportoStotelė',
+                     'Nusikaltimai500MSpinduliuPraėjusįMėnesį']
+variables_categorical = ['PastatoTipas', 'Šildymas', 'Įrengimas', 'NamoNumeris',
+                         'PastatoEnergijosSuvartojimoKlasė', 'ButoNumeris', 'BuildingEnergyClassCategory',
+                         'VidutiniškaiTiekKainuotųŠildymas1Mėn']
+variables_lists = ['Ypatybės', 'PapildomosPatalpos', 'PapildomaĮranga', 'Apsauga']
+
+# Numeric identifiers, by final column name. They are not measurements, so they are left out of the statistics and
+# features.
+variables_identifiers = ['ClusterId']
+
+# Declared column types of the scraped DataFrame, by final (ascii) column name. Integers use the smallest nullable
+# type that fits their range, repeated strings are categoricals. Free text and identifiers stay "object".
+dtypes = {
+    'Plotas': 'UInt16',
+    'KainaMen': 'UInt32',
+    'KambariuSk': 'UInt8',
+    'Aukstas': 'Int8',
+    'AukstuSk': 'UInt8',
+    'Metai': 'UInt16',
+    'ArtimiausiasDarzelis': 'UInt32',
+    'ArtimiausiaMokymoIstaiga': 'UInt32',
+    'ArtimiausiaParduotuve': 'UInt32',
+    'ViesojoTransportoStotele': 'UInt32',
+    'Nusikaltimai500MSpinduliuPraejusiMenesi': 'UInt16',
+    'ListingViewsTotal': 'UInt32',
+    'ListingViewsToday': 'UInt32',
+    'ListingFavorites': 'UInt32',
+
+    'VidutiniskaiTiekKainuotuSildymas1Men': 'float32',
+
+    'PastatoTipas': 'category',
+    'Sildymas': 'category',
+    'Irengimas': 'category',
+    'PastatoEnergijosSuvartojimoKlase': 'category',
+    'BuildingEnergyClass': 'category',
+    'BuildingEnergyClassCategory': 'category',
+    'BuildingCity': 'category',
+    'BuildingNeighbourhood': 'category',
+    'BuildingStreet': 'category',
+    'RealtorName': 'category',
+    'RealtorOrganization': 'category',
+
+    'Realtor': 'uint8',
+
+    'ClusterId': 'UInt32'
+}
+
+# Pseudo-categorical Variable_Value columns, which are either 1 or missing, become 0/1 flags.
+flag_dtype = 'uint8'
+flag_prefixes = tuple(unidecode.unidecode(variable) + '_' for variable in variables_lists)
+
+
+def dtype_of(name):
+    """
+    Parameters
+    ----------
+    name (str): column name.
+
+    Returns
+    -------
+    (str): declared type of the column, None if it is not declared.
+    """
+
+    if name in dtypes:
+        return dtypes[name]
+    if name.startswith(flag_prefixes):
+        return flag_dtype
+    return None
+
+
+def apply_schema(df):
+    """
+    Casts the columns of a scraped DataFrame to their declared types.
+
+    Columns which do not fit into their declared type (e.g. a value out of range or an unparsable number) are logged
+    and left as they are, same as the undeclared columns.
+
+    Parameters
+    ----------
+    df (pandas.DataFrame): scraped data.
+
+    Returns
+    -------
+    pandas.DataFrame: data with compact types.
+    """
+
+    columns = {}
+    for name in df.columns.values:
+        dtype = dtype_of(name)
+        column = df[name]
+
+        if dtype is None:
+            columns[name] = column
+        elif dtype == 'category':
+            columns[name] = column.astype('category')
+        elif dtype == flag_dtype:
+            columns[name] = pd.to_numeric(column).fillna(0).astype(flag_dtype)
+        else:
+            try:
+                columns[name] = pd.to_numeric(column).astype(dtype)
+            except (TypeError, ValueError, OverflowError) as e:
+                logging.warning('Variable {0} does not fit into {1}, leaving it as is: {2}'.format(name, dtype, e))
+                columns[name] = column
+
+    return pd.DataFrame(columns, index=df.index)
+
+
+def memory_usage(df):
+    """
+    Parameters
+    ----------
+    df (pandas.DataFrame): data to measure.
+
+    Returns
+    -------
+    (float): deep memory usage of the DataFrame in megabytes.
+    """
+    return df.memory_usage(deep=True).sum() / 2 ** 20
@@ -0,0 +1,130 @@
+import datetime
+
+
+class SchemaRegistry:
+    def __init__(self, store, date, retire_days=30):
+        """
+        Registry of all the Variable and Value names seen in the scraped data, with the dates they were first and last
+        seen at.
+
+        Names are kept in dictionaries, so checking a day's columns against the history takes linear time in the
+        number of columns, regardless of how large the vocabulary grows. Only the names touched since the last save are
+        written back to the store.
+
+        Parameters
+        ----------
+        store (HistoricalStore): store the names are loaded from and saved to.
+        date (str): ISO formatted date of the observed data.
+        retire_days (int): names not seen for longer than this many days are considered retired and are no longer
+         expected to be present.
+        """
+
+        self.store = store
+        self.date = date
+        self.retire_days = retire_days
+
+        self.names = {
+            'variable': store.load_names('variable'),
+            'value': store.load_names('value')
+        }
+        self.changed = {
+            'variable': set(),
+            'value': set()
+        }
+        pass
+
+    @property
+    def retire_date(self):
+        """
+        Returns
+        -------
+        (str): names last seen before this ISO formatted date are retired.
+        """
+        date = datetime.date.fromisoformat(self.date)
+        return (date - datetime.timedelta(days=self.retire_days)).isoformat()
+
+    def known(self, kind):
+        """
+        Parameters
+        ----------
+        kind (str): 'variable' or 'value'.
+
+        Returns
+        -------
+        (dict): name -> [first_seen, last_seen] of all the names of the given kind.
+        """
+        return self.names[kind]
+
+    def new(self, kind, names):
+        """
+        Parameters
+        ----------
+        kind (str): 'variable' or 'value'.
+        names (iterable): observed names.
+
+        Returns
+        -------
+        (list): observed names that were never seen before, in their order of appearance.
+        """
+        known = self.names[kind]
+        return [name for name in dict.fromkeys(names) if name not in known]
+
+    def missing(self, kind, names):
+        """
+        Parameters
+        ----------
+        kind (str): 'variable' or 'value'.
+        names (iterable): observed names.
+
+        Returns
+        -------
+        (list): active (not retired) names that were not observed.
+        """
+        names = set(names)
+        retire_date = self.retire_date
+        return [name for name, (_, last_seen) in self.names[kind].items() if
+                (last_seen >= retire_date) and (name not in names)]
+
+    def retired(self, kind):
+        """
+        Parameters
+        ----------
+        kind (str): 'variable' or 'value'.
+
+        Returns
+        -------
+        (list): names that were not seen for longer than retire_days.
+        """
+        retire_date = self.retire_date
+        return [name for name, (_, last_seen) in self.names[kind].items() if last_seen < retire_date]
+
+    def observe(self, kind, names):
+        """
+        Records the names as seen at self.date.
+
+        Parameters
+        ----------
+        kind (str): 'variable' or 'value'.
+        names (iterable): observed names.
+        """
+
+        known = self.names[kind]
+        for name in names:
+            if name not in known:
+                known[name] = [self.date, self.date]
+                self.changed[kind].add(name)
+            elif known[name][1] != self.date:
+                known[name][0] = min(known[name][0], self.date)
+                known[name][1] = max(known[name][1], self.date)
+                self.changed[kind].add(name)
+        pass
+
+    def save(self):
+        """
+        Writes the names changed since the last save to the store.
+        """
+
+        for kind, changed in self.changed.items():
+            self.store.upsert_names(kind, {name: self.names[kind][name] for name in changed})
+            changed.clear()
+        pass
@@ -31,9 +31,18 @@ import time
 import logging
 import tqdm
 
+import list_features
+import schema
+from deduplication import Deduplicator
+from profiling import Profiler
+from scheduler import RevisitScheduler
+from description_store import DescriptionStore
+from page_archive import PageArchive
+
 
 class Scraper:
-    def __init__(self, max_retries=3, verbose=True):
+    def __init__(self, max_retries=3, verbose=True, list_format='wide', deduplicate=False, profile=False,
+                 schedule=False, store_descriptions=False, archive=False, offline=False):
         """
         Class that scrapes the given website. Use the scraping method is Scraper().scrape.
 
@@ -41,11 +50,39 @@ class Scraper:
         ----------
         max_retries (int): Number of retries to reset the Tor connections, selenium browsers etc.
         verbose (bool): Whether to display a scraping progress bar.
+        list_format (str): How to output the pseudo-categorical list variables. Either 'wide' - one Variable_Value = 1
+         column per value in the DataFrame, or 'long' - a separate (ListingUrl, Variable, Value) table, stored in
+         self.list_features. See list_features.py for sparse and wide conversions of the latter.
+        deduplicate (bool): Whether to add a ClusterId column, shared by near-duplicate listings. Uses a persistent
+         signature index, see deduplication.py.
+        profile (bool): Whether to profile the run - stage timings per url, the slowest urls with their page sources
+         and a flamegraph-compatible stack sample file, dumped into profiles/ at the end of scrape().
+        schedule (bool): Whether to crawl only the listings picked by the revisit scheduler - new listings first, then
+         the ones most likely to have changed, within the daily request budget of config_scraper.json. Otherwise, all
+         of the listings are crawled. scrape() still returns all of the listed listings, the ones not crawled with
+         their latest crawled rows, while only the crawled ones are kept in self.crawled (and
+         self.crawled_list_features). See scheduler.py.
+        store_descriptions (bool): Whether to move ObjectDescription into a compressed content-addressed store, leaving
+         an ObjectDescriptionHash column in the DataFrame. See description_store.py.
+        archive (bool): Whether to archive the page source of every listing, so it can be re-extracted offline. See
+         page_archive.py and reprocess.py.
+        offline (bool): Whether to skip building the proxy session, for extracting and processing archived pages only.
         """
 
+        if list_format not in ['wide', 'long']:
+            raise ValueError('list_format must be either "wide" or "long", got "{}".'.format(list_format))
+
         # Initialize class variables.
         self.max_retries = max_retries
         self.verbose = verbose
+        self.list_format = list_format
+        self.list_features = None
+        self.crawled = None
+        self.crawled_list_features = None
+        self.list_variables = [unidecode.unidecode(variable) for variable in schema.variables_lists]
+        self.deduplicator = Deduplicator() if deduplicate else None
+        self.profiler = Profiler('scraper', enabled=profile)
+        self.description_store = DescriptionStore() if store_descriptions else None
 
         # Setup Logging.
         # TODO: Set this up with Google Cloud Functions. How?
@@ -62,8 +99,11 @@ class Scraper:
         with open("config_scraper.json") as f:
             self.config = json.load(f)
 
+        self.scheduler = RevisitScheduler(**self.config['scheduler']) if schedule else None
+        self.archive = PageArchive(**self.config['archive']) if archive else None
+
         # Get initial proxied session.
-        self.session = self.get_proxy_session()
+        self.session = self.get_proxy_session() if not offline else None
         pass
 
     def get_proxy(self):
@@ -298,7 +338,32 @@ class Scraper:
         # There are urls that are auto-generated with each page visit, possibly honeypots for scraper catchers.
         listing_urls = [url for url in listing_urls if self.config['urls']['honeypot'] not in url]
 
-        return listing_urls
+        # Listings shifting between the pages while they are crawled are listed twice, keep the first one.
+        unique_urls = list(dict.fromkeys(listing_urls))
+        if len(unique_urls) < len(listing_urls):
+            logging.info('Removed {} duplicate listing urls.'.format(len(listing_urls) - len(unique_urls)))
+
+        return unique_urls
+
+    def record_navigation_timing(self):
+        """
+        Records the fetch (request start to the last byte of the document) and render (from there to the end of the
+        load event) times of the page currently loaded in the driver, from the Navigation Timing API.
+        """
+
+        try:
+            timing = self.driver.execute_script(
+                "var t = performance.getEntriesByType('navigation')[0];"
+                "return t ? [t.startTime, t.responseEnd, t.loadEventEnd] : null;")
+        except Exception as e:
+            logging.warning('Failed to get the navigation timing: {}'.format(e))
+            return
+
+        if timing is not None:
+            start, response_end, load_end = timing
+            self.profiler.record('fetch', max(response_end - start, 0) / 1000)
+            self.profiler.record('render', max(load_end - response_end, 0) / 1000)
+        pass
 
     def parse_object_data(self, url):
         """
@@ -321,8 +386,15 @@ class Scraper:
         """
 
         # Get page source data, parse into a soup.
-        self.driver.get(url)
-        page_source = self.driver.page_source
+        # driver.get returns once the page has loaded and its JS has run. The browser's navigation timing splits that
+        # into fetching the document and rendering it, the remainder of the 'load' span is the driver overhead.
+        with self.profiler.span('load'):
+            self.driver.get(url)
+            if self.profiler.enabled:
+                self.record_navigation_timing()
+        with self.profiler.span('page_source'):
+            page_source = self.driver.page_source
+        self.profiler.record_html(page_source)
 
         soup = BeautifulSoup(page_source, 'lxml')
 
@@ -357,6 +429,27 @@ class Scraper:
                 logging.error(error_message)
                 raise TimeoutError(error_message)
 
+        if self.archive is not None:
+            with self.profiler.span('archive'):
+                self.archive.put(url, page_source)
+
+        return self.extract_object_data(soup, url)
+
+    def extract_object_data(self, soup, url):
+        """
+        Extracts the object data from the page source of a listing, either freshly scraped or archived.
+
+
+        Parameters
+        ----------
+        soup (bs4.BeautifulSoup): Parsed page source.
+        url (str): Page url.
+
+        Returns
+        -------
+        (dict): Object data found in the page, None in the case of a dead / scraper catcher url.
+        """
+
         # Find all name and item classes within object details class. Multiple tag values in config are necessary
         # because this website was built by monkeys.
         object_details_class = soup.find(class_=self.config['html_tags']['object_details'])
@@ -473,13 +566,10 @@ class Scraper:
         object_data (dict): Processed dictionary.
         """
 
-        variables_integer = ['Plotas', 'KainaMėn', 'KambariųSk', 'Aukštas', 'AukštųSk', 'Metai', 'ArtimiausiasDarželis',
-                             'ArtimiausiaMokymoĮstaiga', 'ArtimiausiaParduotuvė', 'ViešojoTransportoStotelė',
-                             'Nusikaltimai500MSpinduliuPraėjusįMėnesį']
-        variables_categorical = ['PastatoTipas', 'Šildymas', 'Įrengimas', 'NamoNumeris',
-                                 'PastatoEnergijosSuvartojimoKlasė', 'ButoNumeris', 'BuildingEnergyClassCategory',
-                                 'VidutiniškaiTiekKainuotųŠildymas1Mėn']
-        variables_lists = ['Ypatybės', 'PapildomosPatalpos', 'PapildomaĮranga', 'Apsauga']
+        # Variable lists are shared with the DataFrame schema, see schema.py.
+        variables_integer = schema.variables_integer
+        variables_categorical = schema.variables_categorical
+        variables_lists = schema.variables_lists
         variables_drop = []
 
         # Transform keys from whatever messy format to VariableName.
@@ -513,6 +603,11 @@ class Scraper:
                 # Convert space delimited text to TitleCamelCase. E.g. 'This house' -> 'ThisHouse'.
                 object_data[variable] = [''.join(item.title().split(' ')) for item in object_data[variable]]
 
+                # Long format keeps the list, which is split into a separate table in get_object_data.
+                if self.list_format == 'long':
+                    object_data[variable] = [unidecode.unidecode(item) for item in object_data[variable]]
+                    continue
+
                 # Create a pseudo categorical variable where multiple values in a category is present.
                 for feature in object_data[variable]:
                     object_data[variable + '_' + feature] = 1
@@ -554,7 +649,53 @@ class Scraper:
 
         return object_data
 
-    def get_object_data(self, listing_urls):
+    def process_listing(self, listing_data):
+        """
+        Processes the object data of a single listing, splitting off its list variables in the long format. Shared by
+        the live scraping and the offline reprocessing, so both produce the same output.
+
+
+        Parameters
+        ----------
+        listing_data (dict): Object data, as returned by extract_object_data.
+
+        Returns
+        -------
+        (dict, list): Processed object data and its (ListingUrl, Variable, Value) rows, empty unless list_format='long'.
+        """
+
+        object_data = self.process_object_data(listing_data)
+
+        list_feature_rows = []
+        if self.list_format == 'long':
+            list_feature_rows = list_features.explode(object_data['ListingUrl'], object_data, self.list_variables)
+
+        return object_data, list_feature_rows
+
+    def build_frame(self, records, list_feature_rows):
+        """
+        Builds the DataFrame once, with the compact types of schema.py, instead of growing it row by row. With
+        list_format='long', the list variables are stored in self.list_features.
+
+
+        Parameters
+        ----------
+        records (list): Processed object data of the listings.
+        list_feature_rows (list): (ListingUrl, Variable, Value) rows of the listings.
+
+        Returns
+        -------
+        (pandas.DataFrame): Object data of the listings.
+        """
+
+        data = schema.apply_schema(pd.DataFrame.from_records(records))
+
+        if self.list_format == 'long':
+            self.list_features = list_features.to_long(list_feature_rows)
+
+        return data
+
+    def get_object_data(self, listing_urls, on_batch=None, batch_size=100):
         """
         Gets object data for all of the urls in listing_urls.
 
@@ -564,35 +705,51 @@ class Scraper:
         Parameters
         ----------
         listing_urls (list): Urls to get the object data from.
+        on_batch (callable): Called with (DataFrame, list features DataFrame or None, number of pages fetched) of the
+         listings scraped since the previous call, every batch_size urls, e.g. FormatVerifier.verify_batch. Any
+         exception it raises aborts the scraping.
+        batch_size (int): Number of urls per on_batch call.
 
         Returns
         -------
-        (list): Object data for each of the given urls.
+        (pandas.DataFrame): Object data for each of the given urls, cast to the types declared in schema.py. With
+         list_format='long', the list variables are stored in self.list_features instead.
 
         Raises
         ------
         TimeoutError: In the case of retries exceeding self.max_retries while restarting selenium.
         """
 
+        # Every listing is scraped once, the list features are keyed by ListingUrl.
+        listing_urls = list(dict.fromkeys(listing_urls))
+
         # Optional parameter to display a progress bar.
         if self.verbose:
-            loop = tqdm.tqdm(listing_urls[:20])
+            loop = tqdm.tqdm(listing_urls)
         else:
             loop = listing_urls
 
-        data = pd.DataFrame()
+        records = []
+        list_feature_rows = []
+        batch_records, batch_rows, batch_pages = 0, 0, 0
         self.driver = webdriver.Chrome(ChromeDriverManager().install())
-        for listing_url in loop:
+        for i, listing_url in enumerate(loop):
 
             # Restarts selenium if it crashes (which happen quite often).
             correct_output = False
             retries = 0
             while not correct_output:
                 try:
-                    listing_data = self.parse_object_data(listing_url)
+                    with self.profiler.url(listing_url):
+                        with self.profiler.span('parse'):
+                            listing_data = self.parse_object_data(listing_url)
 
-                    if listing_data is not None:
-                        data = data.append(pd.Series(self.process_object_data(listing_data)), ignore_index=True)
+                        if listing_data is not None:
+                            with self.profiler.span('process'):
+                                object_data, object_list_feature_rows = self.process_listing(listing_data)
+
+                            records.append(object_data)
+                            list_feature_rows.extend(object_list_feature_rows)
 
                     correct_output = True
                     continue
@@ -602,8 +759,9 @@ class Scraper:
                     logging.warning(e)
 
                     # Restart the driver.
-                    self.driver.quit()
-                    self.driver = webdriver.Chrome(ChromeDriverManager().install())
+                    with self.profiler.span('restart'):
+                        self.driver.quit()
+                        self.driver = webdriver.Chrome(ChromeDriverManager().install())
 
                     # Raise TimeoutError if retries >= self.max_retries.
                     retries += 1
@@ -612,10 +770,59 @@ class Scraper:
                         logging.error(error_message)
                         raise TimeoutError(error_message)
 
+            # Hand the listings scraped since the previous batch over, e.g. for fail-fast verification.
+            if (on_batch is not None) and (((i + 1) % batch_size == 0) or (i + 1 == len(listing_urls))):
+                batch = schema.apply_schema(pd.DataFrame.from_records(records[batch_records:]))
+                batch_list_features = list_features.to_long(list_feature_rows[batch_rows:]) \
+                    if self.list_format == 'long' else None
+
+                try:
+                    with self.profiler.span('batch'):
+                        on_batch(batch, batch_list_features, i + 1 - batch_pages)
+                except Exception:
+                    # The pages archived so far can still be reprocessed, see reprocess.py.
+                    self.driver.quit()
+                    if self.archive is not None:
+                        self.archive.flush()
+                    raise
+
+                batch_records, batch_rows, batch_pages = len(records), len(list_feature_rows), i + 1
+
         self.driver.quit()
-        return data
+        if self.archive is not None:
+            self.archive.flush()
 
-    def scrape(self):
+        return self.build_frame(records, list_feature_rows)
+
+    def postprocess(self, df, date=None):
+        """
+        Enriches the scraped listings - near-duplicate clusters and the description store, if enabled.
+
+
+        Parameters
+        ----------
+        df (pandas.DataFrame): Object data, as returned by get_object_data.
+        date (str): ISO formatted date the listings were scraped on, today if None.
+
+        Returns
+        -------
+        (pandas.DataFrame): Enriched object data.
+        """
+
+        if self.deduplicator is not None:
+            logging.info('Finding near-duplicate listings.')
+            with self.profiler.span('deduplicate'):
+                df = self.deduplicator.assign_clusters(df, date)
+
+        # After deduplication, which needs the full texts.
+        if self.description_store is not None:
+            logging.info('Storing the descriptions.')
+            with self.profiler.span('descriptions'):
+                df = self.description_store.split(df, date)
+
+        return df
+
+    def scrape(self, on_batch=None, verify=None):
         """
         Main method of scraping combining all of the methods within the class.
 
@@ -623,18 +830,59 @@ class Scraper:
 
         TODO: Object description might have ,'s and "'s, which make saving to csv dangerous. Figure out how to fix it.
 
+        Parameters
+        ----------
+        on_batch (callable): Called with micro-batches of the listings while scraping, see get_object_data.
+        verify (callable): Called with the scraped listings and self.list_features, before anything is recorded - the
+         revisit history, the archive retention, the near-duplicate index, the description store and the snapshot.
+         Should raise if the data must not be recorded, e.g. FormatVerifier.verify.
+
         Returns
         -------
         pandas.DataFrame: Data containing all of the processed-raw (none of the information removed) lissting data from
-        the website.
+        the website. With schedule, the crawled listings merged with the latest crawled rows of the other listed ones.
         """
 
-        logging.info('Getting the urls.')
-        listing_urls = self.get_urls()
-        logging.info('Getting the urls was successful.')
+        self.profiler.start()
+
+        # The profile is dumped for failed runs as well, those are the ones worth looking into.
+        try:
+            logging.info('Getting the urls.')
+            with self.profiler.span('urls'):
+                listing_urls = self.get_urls()
+            logging.info('Getting the urls was successful.')
+
+            crawled_urls = listing_urls
+            if self.scheduler is not None:
+                with self.profiler.span('schedule'):
+                    crawled_urls = self.scheduler.schedule(listing_urls)
+
+            logging.info('Getting and parsing the object data.')
+            df = self.get_object_data(crawled_urls, on_batch)
+            logging.info('Getting and parsing the object data was successful.')
+
+            # Nothing persistent is updated from data which fails verification.
+            if verify is not None:
+                with self.profiler.span('verify'):
+                    verify(df, self.list_features)
+
+            if self.scheduler is not None:
+                self.scheduler.update(df, crawled_urls)
+
+            if self.archive is not None:
+                self.archive.prune()
+
+            df = self.postprocess(df)
+            self.crawled, self.crawled_list_features = df, self.list_features
+
+            # Only a part of the listings is crawled, the rest keep their latest crawled rows.
+            if self.scheduler is not None:
+                with self.profiler.span('snapshot'):
+                    df, self.list_features = self.scheduler.merge_snapshot(df, listing_urls, crawled_urls,
+                                                                           self.list_features)
+        finally:
+            self.profiler.dump()
 
-        logging.info('Getting and parsing the object data.')
-        df = self.get_object_data(listing_urls)
-        logging.info('Getting and parsing the object data was successful, returning the DataFrame.')
+        logging.info('Returning the DataFrame.')
 
         return df